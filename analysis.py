@@ -0,0 +1,532 @@
+"""Audio analysis stages shared by the web app (app.py) and the desktop player.
+
+Tracks are decoded to PCM with ffmpeg (any format; FFMPEG or PATH) or, for
+.wav files, the stdlib wave module, and analysed with vectorised NumPy.
+Both are optional: without them a stage reports itself unavailable and the
+app keeps serving whatever was computed elsewhere (e.g. at build time).
+
+  AnalysisIndex  per-track results, incremental by (size, mtime):
+                 waveform min/max peaks at several resolutions (compact
+                 binary files keyed by content hash) and integrated
+                 loudness / sample peak for playback normalisation
+  ArtIndex       embedded cover art (mutagen + Pillow), deduplicated by
+                 image hash into square WebP thumbnails
+"""
+from abc import ABC, abstractmethod
+from functools import lru_cache, partial
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import threading
+import wave
+
+from library import map_in_pool
+
+
+class AnalysisUnavailable(Exception):
+    """NumPy, Pillow/mutagen or a decoder for this file is missing."""
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_path():
+    return os.environ.get('FFMPEG') or shutil.which('ffmpeg')
+
+
+def _numpy():
+    try:
+        import numpy   # optional dependency
+    except ImportError as e:
+        raise AnalysisUnavailable('numpy is not installed') from e
+    return numpy
+
+
+def available():
+    """True if NumPy and ffmpeg are both present (any format can be analysed)."""
+    try:
+        _numpy()
+    except AnalysisUnavailable:
+        return False
+    return bool(ffmpeg_path())
+
+
+def file_hash(path):
+    """Content hash used to key analysis results (32 hex chars of SHA-256)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()[:32]
+
+
+def decode_pcm(path, rate=None, channels=1):
+    """Decode a file to float32 samples in [-1, 1], shape (frames, channels).
+
+    Returns (samples, sample_rate). With a `rate`, ffmpeg resamples to it and
+    mixes to `channels`; the wave fallback (used without ffmpeg or `rate`)
+    keeps the file's rate and only down-mixes.
+    """
+    np = _numpy()
+    ff = ffmpeg_path()
+    if ff and rate:
+        proc = subprocess.run([ff, '-v', 'error', '-nostdin', '-i', path, '-map', '0:a:0',
+                               '-ac', str(channels), '-ar', str(rate), '-f', 'f32le', '-'],
+                              capture_output=True)
+        if proc.returncode:
+            raise ValueError(proc.stderr.decode(errors='replace').strip() or 'ffmpeg failed')
+        return np.frombuffer(proc.stdout, '<f4').reshape(-1, channels), rate
+    if not path.lower().endswith('.wav'):
+        raise AnalysisUnavailable('ffmpeg is needed to decode this format')
+    with wave.open(path, 'rb') as w:
+        width, n_ch, sr = w.getsampwidth(), w.getnchannels(), w.getframerate()
+        raw = w.readframes(w.getnframes())
+    if width == 1:
+        x = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        x = np.frombuffer(raw, '<i2').astype(np.float32) / 32768
+    elif width == 3:
+        b = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        x = ((b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8).astype(np.float32) / 8388608
+    else:
+        x = np.frombuffer(raw, '<i4').astype(np.float32) / 2147483648
+    x = x.reshape(-1, n_ch)
+    if channels == 1 and n_ch > 1:
+        x = x.mean(axis=1, keepdims=True)
+    return x, sr
+
+
+# ── Waveform peaks ─────────────────────────────────────────
+# Each level splits the whole track into a fixed number of buckets and keeps
+# the (min, max) sample of each, quantised to int8. Coarser levels are
+# reductions of the finest, so every level divides PEAK_LEVELS[-1].
+#
+# File layout (little-endian):
+#   b'LKPK' | u8 version | u8 level count | u16 reserved | u32 sample rate |
+#   u32 frames | u32 buckets per level … | int8 [min, max] pairs, level by level
+PEAK_LEVELS   = (128, 512, 2048)
+PEAK_MAGIC    = b'LKPK'
+_PEAK_HEAD    = struct.Struct('<4sBBHII')
+ANALYSIS_RATE = 22050   # decode rate: enough for both peaks and K-weighting
+
+
+def compute_peaks(samples, levels=PEAK_LEVELS):
+    """[(min, max) int8 array of shape (buckets, 2)] per level for mono samples."""
+    np = _numpy()
+    finest = levels[-1]
+    x = np.asarray(samples, np.float32).reshape(-1)
+    if x.size == 0:
+        x = np.zeros(1, np.float32)
+    # Pad (repeating the last sample) to a whole number of samples per bucket
+    per = -(-x.size // finest)
+    x   = np.pad(x, (0, per * finest - x.size), mode='edge').reshape(finest, per)
+    lo, hi = x.min(axis=1), x.max(axis=1)
+    out = []
+    for n in levels:
+        group = finest // n
+        pair  = np.stack([lo.reshape(n, group).min(axis=1), hi.reshape(n, group).max(axis=1)], axis=1)
+        out.append(np.clip(np.round(pair * 127), -127, 127).astype(np.int8))
+    return out
+
+
+def encode_peaks(levels, rate, frames):
+    head = _PEAK_HEAD.pack(PEAK_MAGIC, 1, len(levels), 0, rate, frames)
+    counts = struct.pack(f'<{len(levels)}I', *(len(lv) for lv in levels))
+    return head + counts + b''.join(lv.tobytes() for lv in levels)
+
+
+def decode_peaks(data):
+    """Inverse of encode_peaks: (rate, frames, [bytes of (min, max) pairs per level])."""
+    magic, version, n, _, rate, frames = _PEAK_HEAD.unpack_from(data)
+    if magic != PEAK_MAGIC or version != 1:
+        raise ValueError('not a peaks file')
+    counts = struct.unpack_from(f'<{n}I', data, _PEAK_HEAD.size)
+    pos, levels = _PEAK_HEAD.size + 4 * n, []
+    for c in counts:
+        levels.append(data[pos:pos + 2 * c])
+        pos += 2 * c
+    return rate, frames, levels
+
+
+def _peaks_file(out_dir, digest):
+    return os.path.join(out_dir, digest[:2], f'{digest}.peaks')
+
+
+# ── Loudness ───────────────────────────────────────────────
+# Integrated loudness as in ITU-R BS.1770-4: K-weighted mean square over
+# 400 ms blocks (75% overlap) with a -70 LUFS absolute and a -10 LU relative
+# gate. The K-weighting is applied per 100 ms segment in the frequency
+# domain (|rfft|² × |H|²), which vectorises the whole track but ignores the
+# filter's state across segment edges; the difference on music is far below
+# what a playback gain can resolve.
+_ABS_GATE = -70.0
+_REL_GATE = -10.0
+
+
+def _k_weighting_power(freqs, rate):
+    """|H(f)|² of the BS.1770 K-weighting filter (high shelf, then RLB high-pass) at `rate`."""
+    np = _numpy()
+    z  = np.exp(-2j * np.pi * freqs / rate)   # z⁻¹ on the unit circle
+    k  = np.tan(np.pi * 1681.974450955533 / rate)
+    q  = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (((vh + vb * k / q + k * k) + 2 * (k * k - vh) * z + (vh - vb * k / q + k * k) * z * z)
+             / (a0 + 2 * (k * k - 1) * z + (1 - k / q + k * k) * z * z))
+    k  = np.tan(np.pi * 38.13547087602444 / rate)
+    q  = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = (1 - 2 * z + z * z) / (1 + 2 * (k * k - 1) / a0 * z + (1 - k / q + k * k) / a0 * z * z)
+    return np.abs(shelf * highpass) ** 2
+
+
+def measure_loudness(samples, rate, chunk=512):
+    """(integrated loudness in LUFS, sample peak in dBFS) of (frames, channels) samples.
+
+    Either value is None for silence (or, for loudness, under 400 ms of audio);
+    both are None for empty input.
+    """
+    np = _numpy()
+    x    = np.asarray(samples, np.float32)
+    if not x.size:
+        return None, None
+    x    = x.reshape(len(x), -1)
+    peak = float(np.abs(x).max())
+    peak_db = round(float(20 * np.log10(peak)), 2) if peak > 0 else None
+    seg = int(rate * 0.1)
+    n   = len(x) // seg
+    if n < 4:
+        return None, peak_db
+
+    # Parseval for a real FFT: interior bins stand for two conjugate bins
+    weight = _k_weighting_power(np.fft.rfftfreq(seg, 1 / rate), rate)
+    weight[1:(seg + 1) // 2] *= 2
+    energy = np.empty(n)
+    for i in range(0, n, chunk):
+        block = x[i * seg:min(i + chunk, n) * seg].reshape(-1, seg, x.shape[1])
+        power = np.abs(np.fft.rfft(block, axis=1)) ** 2
+        # Σ over bins and channels (front channels weigh 1.0)
+        energy[i:i + len(block)] = np.einsum('bfc,f->b', power, weight) / seg
+
+    z  = np.convolve(energy, np.ones(4), mode='valid') / (4 * seg)   # mean square per 400 ms block
+    lk = -0.691 + 10 * np.log10(np.maximum(z, 1e-20))
+    z  = z[lk > _ABS_GATE]
+    if not z.size:
+        return None, peak_db
+    relative = -0.691 + 10 * np.log10(z.mean()) + _REL_GATE
+    z = z[-0.691 + 10 * np.log10(z) > relative]
+    return round(float(-0.691 + 10 * np.log10(z.mean())), 2), peak_db
+
+
+def gain_db(loudness, peak_db, target, ceiling=-1.0):
+    """Playback gain that brings `loudness` to `target` without pushing the peak past `ceiling` dBFS."""
+    if loudness is None:
+        return None
+    gain = target - loudness
+    if peak_db is not None:
+        gain = min(gain, ceiling - peak_db)
+    return round(gain, 1)
+
+
+def _write_atomic(target, data):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f'{target}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+# ── Per-track analysis ─────────────────────────────────────
+def analyze_track(out_dir, path):
+    """Decode `path` once; write its peaks file and measure its loudness.
+
+    Returns (hash, loudness, peak_db); all None if the file cannot be read
+    or decoded. Runs in pool workers, so it must stay importable at module level.
+    """
+    try:
+        digest = file_hash(path)
+        samples, rate = decode_pcm(path, ANALYSIS_RATE, channels=2)
+        loudness, peak_db = measure_loudness(samples, rate)
+        target = _peaks_file(out_dir, digest)
+        if not os.path.exists(target):   # identical content may be analysed under another path
+            _write_atomic(target, encode_peaks(compute_peaks(samples.mean(axis=1)), rate, len(samples)))
+    except (AnalysisUnavailable, ValueError, OSError, EOFError, wave.Error):
+        return None, None, None
+    return digest, loudness, peak_db
+
+
+# ── Cover art ──────────────────────────────────────────────
+# The embedded front cover (or first picture) of each track, keyed by a hash
+# of the image bytes so an album's art is stored once however many tracks
+# carry it, and resized to square WebP thumbnails:
+#   out_dir/hh/<hash>-<size>.webp
+ART_SIZES   = (96, 300, 600)   # track list, hero, full player / lock screen
+ART_QUALITY = 80
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageOps   # optional dependency
+        import mutagen                    # noqa: F401 (needed by embedded_picture)
+    except ImportError as e:
+        raise AnalysisUnavailable('Pillow and mutagen are needed for cover art') from e
+    return Image, ImageOps
+
+
+def art_file(out_dir, digest, size):
+    return os.path.join(out_dir, digest[:2], f'{digest}-{size}.webp')
+
+
+def embedded_picture(path):
+    """Bytes of the picture embedded in `path`, preferring the front cover; None if there is none.
+
+    Reads ID3 APIC frames (MP3, also AIFF/WAV), MP4 `covr` atoms and FLAC
+    picture blocks.
+    """
+    try:
+        import mutagen
+        audio = mutagen.File(path)
+    except Exception:
+        return None
+    if audio is None:
+        return None
+    tags, pictures = audio.tags, []   # [(is_front_cover, data)]
+    if tags is not None and hasattr(tags, 'getall'):
+        pictures += [(p.type == 3, p.data) for p in tags.getall('APIC')]
+    elif tags is not None and 'covr' in tags:
+        pictures += [(True, bytes(c)) for c in tags['covr']]
+    pictures += [(p.type == 3, p.data) for p in getattr(audio, 'pictures', ())]
+    pictures = [p for p in pictures if p[1]]
+    return max(pictures, key=lambda p: p[0])[1] if pictures else None
+
+
+def extract_art(out_dir, path, sizes=ART_SIZES):
+    """Write thumbnails of `path`'s embedded art unless they exist; returns the image hash.
+
+    Returns None if the track has no (decodable) picture. Runs in pool
+    workers, so it must stay importable at module level.
+    """
+    data = embedded_picture(path)
+    if data is None:
+        return None
+    digest  = hashlib.sha256(data).hexdigest()[:32]
+    targets = {size: art_file(out_dir, digest, size) for size in sizes}
+    if all(os.path.exists(t) for t in targets.values()):   # same art on another track
+        return digest
+    Image, ImageOps = _pillow()
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft('RGB', (max(sizes), max(sizes)))   # JPEG: decode at a reduced scale
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            for size, target in targets.items():
+                buf = io.BytesIO()
+                ImageOps.fit(img, (size, size), Image.LANCZOS).save(buf, 'WEBP', quality=ART_QUALITY)
+                _write_atomic(target, buf.getvalue())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return digest
+
+
+# ── Incremental indexes ────────────────────────────────────
+class _TrackIndex(ABC):
+    """Per-path results keyed by (size, mtime) in `out_dir`/index.db.
+
+    Subclasses set the table, its schema, the result columns and the pool
+    worker. A rescan only processes files whose signature changed, and an
+    instance without the audio (Supabase mode) can serve results computed
+    at build time for the same library paths.
+    """
+    _table   = None
+    _schema  = None
+    _columns = ()
+
+    def __init__(self, root, out_dir, workers=None):
+        self.root     = root
+        self.out_dir  = out_dir
+        self.db_path  = os.path.join(out_dir, 'index.db')
+        self.workers  = workers
+        self._entries = None   # {rel_path: (size, mtime_ns, *_columns)}
+        self._lock    = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if not os.path.exists(self.db_path):
+            return
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                for path, *entry in conn.execute(
+                        f'SELECT path, size, mtime_ns, {", ".join(self._columns)} FROM {self._table}'):
+                    self._entries[path] = tuple(entry)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            self._entries = {}
+
+    def _entry(self, rel, sig):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(rel)
+        if entry is None or (sig is not None and entry[:2] != tuple(sig)):
+            return None
+        return entry
+
+    def stale(self, files):
+        """Paths in {rel: (size, mtime_ns)} not processed at their current signature."""
+        with self._lock:
+            self._load()
+            return [rel for rel, sig in files.items()
+                    if (e := self._entries.get(rel)) is None or e[:2] != tuple(sig)]
+
+    def _runnable(self, todo):
+        """The subset of `todo` this environment can process; raises AnalysisUnavailable if none can be.
+
+        Paths left out are recorded with NULL results at their signature, like
+        files the worker could not read, so they do not stay stale forever.
+        """
+        return todo
+
+    @abstractmethod
+    def _worker(self):
+        """Picklable callable run on each absolute path in the pool."""
+
+    def _row(self, result):
+        """Worker result as a tuple of `_columns` values."""
+        return tuple(result)
+
+    def update(self, files, rels=None):
+        """Process new/changed files from {rel: (size, mtime_ns)}; returns how many.
+
+        Pass `rels` to process just those paths (e.g. one track on demand).
+        """
+        todo = self.stale(files) if rels is None else [r for r in rels if r in files]
+        with self._lock:
+            gone = [] if rels is not None else [rel for rel in self._entries if rel not in files]
+        if not todo and not gone:
+            return 0
+        runnable = self._runnable(todo) if todo else todo
+        skipped  = set(todo).difference(runnable)
+
+        abs_paths = {os.path.join(self.root, *rel.split('/')): rel for rel in runnable}
+        results   = {rel: (*files[rel], *(None,) * len(self._columns)) for rel in skipped}
+        for path, result in map_in_pool(self._worker(), list(abs_paths), self.workers, min_batch=2):
+            rel = abs_paths[path]
+            results[rel] = (*files[rel], *self._row(result))
+
+        with self._lock:
+            for rel in gone:
+                self._entries.pop(rel, None)
+            self._entries.update(results)
+        self._save(results, gone)
+        return len(results)
+
+    def _save(self, results, gone):
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10)
+        except (OSError, sqlite3.Error):
+            return
+        try:
+            with conn:
+                conn.executescript(self._schema)
+                conn.executemany(f'DELETE FROM {self._table} WHERE path = ?', [(rel,) for rel in gone])
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?{", ?" * len(self._columns)})',
+                    [(rel, *e) for rel, e in results.items()])
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+
+
+_ANALYSIS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS analysis (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash     TEXT,              -- NULL: could not be decoded at this (size, mtime)
+    loudness REAL,              -- integrated LUFS
+    peak_db  REAL               -- sample peak, dBFS
+);
+'''
+
+
+class AnalysisIndex(_TrackIndex):
+    """Waveform peaks (files under `out_dir` by content hash) and loudness per library path."""
+    _table   = 'analysis'
+    _schema  = _ANALYSIS_SCHEMA
+    _columns = ('hash', 'loudness', 'peak_db')
+
+    def lookup(self, rel, sig=None):
+        """Content hash of `rel`'s peaks, if analysed (at signature `sig`, when given)."""
+        entry = self._entry(rel, sig)
+        return entry[2] if entry else None
+
+    def loudness(self, rel, sig=None):
+        """(loudness LUFS, peak dBFS) of `rel`, or None if not measured."""
+        entry = self._entry(rel, sig)
+        return entry[3:] if entry and entry[3] is not None else None
+
+    def read(self, digest):
+        try:
+            with open(_peaks_file(self.out_dir, digest), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _runnable(self, todo):
+        _numpy()   # fail fast instead of recording every track as undecodable
+        if not ffmpeg_path():
+            todo = [rel for rel in todo if rel.lower().endswith('.wav')]
+        return todo
+
+    def _worker(self):
+        return partial(analyze_track, self.out_dir)
+
+
+_ART_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS art (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash     TEXT               -- NULL: no embedded picture at this (size, mtime)
+);
+'''
+
+
+class ArtIndex(_TrackIndex):
+    """Embedded cover art per library path; thumbnails live under `out_dir` by image hash."""
+    _table   = 'art'
+    _schema  = _ART_SCHEMA
+    _columns = ('hash',)
+
+    def __init__(self, root, out_dir, workers=None, sizes=ART_SIZES):
+        super().__init__(root, out_dir, workers)
+        self.sizes = tuple(sizes)
+
+    def lookup(self, rel, sig=None):
+        """Image hash of `rel`'s cover art, or None (no art, or not extracted yet)."""
+        entry = self._entry(rel, sig)
+        return entry[2] if entry else None
+
+    def path(self, digest, size):
+        """Thumbnail file for (digest, size), or None if it was never generated."""
+        if size not in self.sizes:
+            return None
+        target = art_file(self.out_dir, digest, size)
+        return target if os.path.exists(target) else None
+
+    def _runnable(self, todo):
+        _pillow()
+        return todo
+
+    def _worker(self):
+        return partial(extract_art, self.out_dir, sizes=self.sizes)
+
+    def _row(self, result):
+        return (result,)
@@ -1,16 +1,43 @@
+import time
+_IMPORT_STARTED = time.perf_counter()   # cold-start instrumentation, see _startup below
+
 from flask import Flask, jsonify, send_from_directory, render_template, request, redirect, session, make_response
-from urllib.parse import quote as urlquote
-from urllib.request import urlopen, Request
-from urllib.error import URLError
-from collections import defaultdict
-from functools import wraps
+from werkzeug.security import safe_join
+from urllib.parse import quote as urlquote, urlsplit
+from urllib.error import HTTPError
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache, wraps
 from datetime import timedelta
+import base64
+import bisect
+import gzip
+import hashlib
+import http.client
 import json
 import os
 import io
+import random
+import re
 import hmac
 import secrets
-import time
+import signal
+import sys
+import threading
+
+from analysis import AnalysisIndex, AnalysisUnavailable, ArtIndex, gain_db
+from library import CatalogStore, LibraryIndex, MetadataIndex, SearchIndex
+from metrics import Registry
+from ratelimit import open_attempt_store
+
+@lru_cache(maxsize=1)
+def _brotli():
+    """The optional brotli module (br responses when installed), imported on first use."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
 
 # Load .env in local dev (no python-dotenv needed)
 _env_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -22,6 +49,41 @@ if os.path.exists(_env_path):
                 _k, _v = _line.split('=', 1)
                 os.environ.setdefault(_k.strip(), _v.strip())
 
+# ── Metrics ────────────────────────────────────────────────
+# Prometheus text at /api/metrics. Histograms are fed inline; cache and pool
+# counters are read from the existing stats() at scrape time (see the bottom
+# of this file), so leaving this on in production costs a bisect per event.
+_metrics = Registry()
+_request_seconds = _metrics.histogram(
+    'leakify_request_duration_seconds', 'Time to produce a response, by route.',
+    ('route', 'method', 'status'))
+_supabase_seconds = _metrics.histogram(
+    'leakify_supabase_call_duration_seconds', 'Supabase Storage REST calls, by call.', ('call',))
+_supabase_errors = _metrics.counter(
+    'leakify_supabase_call_errors_total', 'Supabase Storage REST calls that raised, by call.', ('call',))
+_catalog_phase_seconds = _metrics.histogram(
+    'leakify_catalog_phase_duration_seconds',
+    'Catalog build phases: walk_dedup and sign (Supabase), scan and dedup (local), index and encode.',
+    ('phase',))
+_splash_render_seconds = _metrics.histogram(
+    'leakify_splash_render_duration_seconds', 'Cold /splash renders.')
+
+def _timed_supabase(call):
+    """Decorator: record a Supabase call's latency, and count it if it raises."""
+    def decorate(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            except Exception:
+                _supabase_errors.inc(call)
+                raise
+            finally:
+                _supabase_seconds.observe(time.perf_counter() - t0, call)
+        return wrapper
+    return decorate
+
 # Supabase Storage — direct REST API (no SDK, works with all key formats)
 SUPABASE_URL    = os.environ.get('SUPABASE_URL', '').rstrip('/')
 SUPABASE_KEY    = os.environ.get('SUPABASE_SERVICE_KEY', '')
@@ -37,45 +99,256 @@ def _sb_headers():
         'Content-Type': 'application/json',
     }
 
-def _sb_list(prefix=''):
-    """List files/folders in bucket at given prefix via REST."""
-    url = f'{SUPABASE_URL}/storage/v1/object/list/{SUPABASE_BUCKET}'
-    body = json.dumps({
+# ── Pooled HTTP client ─────────────────────────────────────
+# Every Supabase helper goes through one shared pool of keep-alive
+# connections, so a catalog build pays the TCP+TLS handshake once per
+# pooled connection instead of once per REST call.
+HTTP_POOL_SIZE       = int(os.environ.get('HTTP_POOL_SIZE', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+
+class _HttpPool:
+    """Thread-safe pool of persistent HTTP(S) connections, kept per host."""
+
+    def __init__(self, size, connect_timeout):
+        self.size            = size
+        self.connect_timeout = connect_timeout
+        self.opened          = 0
+        self.reused          = 0
+        self._idle           = defaultdict(list)   # {(scheme, host, port): [conn, ...]}
+        self._lock           = threading.Lock()
+
+    def _checkout(self, key):
+        """Return (conn, reused) — an idle connection for `key`, or a new one."""
+        with self._lock:
+            if self._idle[key]:
+                self.reused += 1
+                return self._idle[key].pop(), True
+            self.opened += 1
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return cls(host, port, timeout=self.connect_timeout), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            if len(self._idle[key]) < self.size:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=30):
+        """Send one request and return the response body.
+
+        `timeout` bounds each socket read; connecting is bounded separately by
+        HTTP_CONNECT_TIMEOUT. Raises HTTPError for 4xx/5xx like urlopen does.
+        """
+        parts = urlsplit(url)
+        key   = (parts.scheme, parts.hostname, parts.port)
+        path  = parts.path + (f'?{parts.query}' if parts.query else '')
+        while True:
+            conn, reused = self._checkout(key)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                conn.sock.settimeout(timeout)
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused:
+                    continue   # server dropped an idle keep-alive connection — retry on a new one
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            if resp.status >= 400:
+                raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(data))
+            return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                'opened': self.opened,
+                'reused': self.reused,
+                'idle':   sum(len(c) for c in self._idle.values()),
+                'size':   self.size,
+            }
+
+_http = _HttpPool(HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT)
+
+def _sb_post(endpoint, payload, timeout):
+    """POST JSON to a Supabase Storage endpoint and decode the JSON reply."""
+    url  = f'{SUPABASE_URL}/storage/v1/{endpoint}/{SUPABASE_BUCKET}'
+    data = _http.request('POST', url, body=json.dumps(payload).encode(),
+                         headers=_sb_headers(), timeout=timeout)
+    return json.loads(data)
+
+SUPABASE_LIST_PAGE    = int(os.environ.get('SUPABASE_LIST_PAGE', '1000'))
+SUPABASE_LIST_WORKERS = int(os.environ.get('SUPABASE_LIST_WORKERS', '8'))
+
+AUDIO_EXTS = {'.mp3', '.m4a', '.wav', '.flac', '.ogg'}
+
+@_timed_supabase('list')
+def _sb_list(prefix='', limit=SUPABASE_LIST_PAGE, offset=0):
+    """List one page of files/folders in bucket at given prefix via REST."""
+    return _sb_post('object/list', {
         'prefix': prefix,
-        'limit': 1000,
-        'offset': 0,
+        'limit': limit,
+        'offset': offset,
         'sortBy': {'column': 'name', 'order': 'asc'},
-    }).encode()
-    req = Request(url, data=body, headers=_sb_headers(), method='POST')
-    with urlopen(req, timeout=15) as r:
-        return json.loads(r.read())
+    }, timeout=15)
+
+def _sb_list_all(prefix=''):
+    """List every entry in one folder, following offsets until it is exhausted.
+
+    Returns (items, requests_made, seconds_spent).
+    """
+    items, offset, requests, seconds = [], 0, 0, 0.0
+    while True:
+        t0 = time.perf_counter()
+        page = _sb_list(prefix, SUPABASE_LIST_PAGE, offset)
+        seconds  += time.perf_counter() - t0
+        requests += 1
+        items.extend(page)
+        if len(page) < SUPABASE_LIST_PAGE:
+            return items, requests, seconds
+        offset += len(page)
+
+# Summary of the most recent full bucket walk (shown in /api/debug)
+_sb_last_walk: dict = {}
+
+def _sb_walk(prefix=''):
+    """Yield every audio path under `prefix` as soon as its folder is listed.
+
+    Sibling folders are listed concurrently on a bounded thread pool, so the
+    caller can start deduplicating before the whole bucket has been walked.
+    """
+    stats = {'requests': 0, 'request_seconds': 0.0, 'folders': 0, 'paths': 0}
+    t0    = time.perf_counter()
+    pool  = ThreadPoolExecutor(max_workers=SUPABASE_LIST_WORKERS, thread_name_prefix='sb-list')
+    try:
+        pending = {pool.submit(_sb_list_all, prefix): prefix}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                folder = pending.pop(fut)
+                items, requests, seconds = fut.result()
+                stats['folders']         += 1
+                stats['requests']        += requests
+                stats['request_seconds'] += seconds
+                for item in items:
+                    name = item.get('name', '')
+                    if name == '.emptyFolderPlaceholder':
+                        continue
+                    full = f"{folder}/{name}" if folder else name
+                    if item.get('id') is None:
+                        # folder — list it alongside its siblings
+                        pending[pool.submit(_sb_list_all, full)] = full
+                    elif os.path.splitext(name)[1].lower() in AUDIO_EXTS:
+                        stats['paths'] += 1
+                        yield full
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        stats['request_seconds'] = round(stats['request_seconds'], 4)
+        stats['wall_seconds']    = round(time.perf_counter() - t0, 4)
+        _sb_last_walk.clear()
+        _sb_last_walk.update(stats)
+        app.logger.info(f'Supabase walk: {stats}')
 
 def _sb_list_recursive(prefix=''):
     """Recursively list all audio files; returns list of bucket-relative paths."""
-    AUDIO_EXTS = {'.mp3', '.m4a', '.wav', '.flac', '.ogg'}
-    items = _sb_list(prefix)
-    results = []
-    for item in items:
-        name = item.get('name', '')
-        if name == '.emptyFolderPlaceholder':
-            continue
-        full = f"{prefix}/{name}" if prefix else name
-        if item.get('id') is None:
-            # folder — recurse
-            results.extend(_sb_list_recursive(full))
-        else:
-            ext = os.path.splitext(name)[1].lower()
-            if ext in AUDIO_EXTS:
-                results.append(full)
-    return results
+    return list(_sb_walk(prefix))
+
+# Batch signing is split into SIGN_CHUNK_SIZE-path requests, SIGN_WORKERS at
+# a time. A chunk that fails is retried SIGN_RETRIES times with exponential
+# backoff; if it still fails only its paths stay unsigned.
+SIGN_CHUNK_SIZE = int(os.environ.get('SIGN_CHUNK_SIZE', '500'))
+SIGN_WORKERS    = int(os.environ.get('SIGN_WORKERS', '4'))
+SIGN_RETRIES    = int(os.environ.get('SIGN_RETRIES', '2'))
+SIGN_BACKOFF    = float(os.environ.get('SIGN_BACKOFF', '0.5'))
+
+# Lazy signing: the catalog is built without signed URLs and clients sign
+# the tracks they are about to show or play, SIGN_REQUEST_MAX per /api/sign call.
+LAZY_SIGNING     = os.environ.get('LAZY_SIGNING', '0') == '1'
+SIGN_REQUEST_MAX = int(os.environ.get('SIGN_REQUEST_MAX', '100'))
+
+# Summary of the most recent batch signing (shown in /api/debug)
+_sb_last_sign: dict = {}
+
+def _sign_retryable(err):
+    """Timeouts, connection errors, 429 and 5xx are worth another try; other 4xx are not."""
+    if isinstance(err, HTTPError):
+        return err.code == 429 or err.code >= 500
+    return isinstance(err, (OSError, http.client.HTTPException))
+
+def _sign_backoff(attempt):
+    """Seconds to wait before retry `attempt` (1-based): exponential with jitter."""
+    return SIGN_BACKOFF * (2 ** (attempt - 1)) * (0.5 + random.random())
+
+def _chunks(paths, size):
+    return [paths[i:i + size] for i in range(0, len(paths), max(size, 1))]
+
+@_timed_supabase('sign')
+def _sb_sign_chunk(paths):
+    """One object/sign request; returns dict {path: signedURL}."""
+    items = _sb_post('object/sign', {'paths': paths, 'expiresIn': SUPABASE_SIGNED_URL_TTL},
+                     timeout=20)
+    return _signed_url_map(items)
+
+def _sb_sign_chunk_retrying(paths, stats):
+    for attempt in range(SIGN_RETRIES + 1):
+        try:
+            return _sb_sign_chunk(paths)
+        except Exception as e:
+            if attempt == SIGN_RETRIES or not _sign_retryable(e):
+                raise
+            stats['retries'] += 1
+            time.sleep(_sign_backoff(attempt + 1))
 
 def _sb_signed_urls(paths):
-    """Batch-generate signed URLs; returns dict {path: signedURL}."""
-    url = f'{SUPABASE_URL}/storage/v1/object/sign/{SUPABASE_BUCKET}'
-    body = json.dumps({'paths': paths, 'expiresIn': SUPABASE_SIGNED_URL_TTL}).encode()
-    req = Request(url, data=body, headers=_sb_headers(), method='POST')
-    with urlopen(req, timeout=20) as r:
-        items = json.loads(r.read())
+    """Batch-generate signed URLs; returns dict {path: signedURL}.
+
+    Paths of chunks that failed for good are left out of the result; paths
+    Supabase refused individually map to ''. Raises the last error only if
+    every chunk failed.
+    """
+    chunks = _chunks(list(paths), SIGN_CHUNK_SIZE)
+    stats  = {'paths': len(paths), 'chunks': len(chunks), 'failed_chunks': 0, 'retries': 0}
+    t0     = time.perf_counter()
+    result, error = {}, None
+    try:
+        if len(chunks) <= 1 or SIGN_WORKERS <= 1:
+            outcomes = []
+            for chunk in chunks:
+                try:
+                    outcomes.append(_sb_sign_chunk_retrying(chunk, stats))
+                except Exception as e:
+                    outcomes.append(e)
+        else:
+            with ThreadPoolExecutor(max_workers=SIGN_WORKERS, thread_name_prefix='sb-sign') as pool:
+                futures  = [pool.submit(_sb_sign_chunk_retrying, chunk, stats) for chunk in chunks]
+                outcomes = [f.exception() or f.result() for f in futures]
+        for chunk, outcome in zip(chunks, outcomes):
+            if isinstance(outcome, Exception):
+                stats['failed_chunks'] += 1
+                error = outcome
+                app.logger.error(f'Supabase sign failed for {len(chunk)} paths: {outcome}')
+            else:
+                result.update(outcome)
+    finally:
+        stats['wall_seconds'] = round(time.perf_counter() - t0, 4)
+        _sb_last_sign.clear()
+        _sb_last_sign.update(stats)
+    if error is not None and stats['failed_chunks'] == len(chunks):
+        raise error
+    return result
+
+def _signed_url_map(items):
+    """Turn an object/sign reply into {path: absolute signed URL}."""
     result = {}
     for item in items:
         p = item.get('path', '')
@@ -92,10 +365,100 @@ def _sb_signed_urls(paths):
             result[p] = signed
     return result
 
+# ── Signed-URL cache ───────────────────────────────────────
+# Signed URLs live SUPABASE_SIGNED_URL_TTL seconds, so each one is reused
+# until SIGNED_URL_MARGIN seconds before it expires. Only missing or
+# nearly-expired paths are sent to Supabase (see _sb_signed_urls for batching).
+SIGNED_URL_MARGIN     = int(os.environ.get('SIGNED_URL_MARGIN', '86400'))
+SIGNED_URL_CACHE_SIZE = int(os.environ.get('SIGNED_URL_CACHE_SIZE', '20000'))
+
+class _SignedUrlCache:
+    """Thread-safe LRU of {bucket path: (signed URL, expires_at)}."""
+
+    def __init__(self, max_entries, margin):
+        self.max_entries = max_entries
+        self.margin      = margin
+        self.hits        = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+
+    def _lookup(self, paths, now):
+        """Split paths into ({path: url} still usable, [paths to sign])."""
+        found, missing = {}, []
+        with self._lock:
+            for p in paths:
+                entry = self._entries.get(p)
+                if entry and entry[1] - self.margin > now:
+                    self._entries.move_to_end(p)
+                    found[p] = entry[0]
+                    self.hits += 1
+                else:
+                    missing.append(p)
+                    self.misses += 1
+        return found, missing
+
+    def _store(self, url_map, expires_at):
+        with self._lock:
+            for p, url in url_map.items():
+                if not url:
+                    continue
+                self._entries[p] = (url, expires_at)
+                self._entries.move_to_end(p)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, paths, refresh=False):
+        """Return {path: signed URL}, signing only the paths not usable from cache."""
+        paths = list(dict.fromkeys(paths))
+        if refresh:
+            found, missing = {}, paths
+        else:
+            found, missing = self._lookup(paths, time.time())
+        if missing:
+            signed_at = time.time()
+            url_map   = _sb_signed_urls(missing)
+            self._store(url_map, signed_at + SUPABASE_SIGNED_URL_TTL)
+            found.update(url_map)
+        return found
+
+    def get(self, path, refresh=False):
+        return self.get_many([path], refresh=refresh).get(path, '')
+
+    def peek(self, path):
+        """Return the cached (url, expires_at) for `path` without counting a lookup."""
+        with self._lock:
+            return self._entries.get(path)
+
+    def seed(self, entries):
+        """Load {path: (url, expires_at)} pairs, e.g. from a catalog snapshot."""
+        with self._lock:
+            for p, entry in entries.items():
+                self._entries.setdefault(p, entry)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries':   len(self._entries),
+                'hits':      self.hits,
+                'misses':    self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+            }
+
+_signed_urls = _SignedUrlCache(SIGNED_URL_CACHE_SIZE, SIGNED_URL_MARGIN)
+
 _supabase_error = None  # populated if init-time test fails
 
 # Vercel fallback (GitHub LFS CDN) — used only if Supabase is not configured.
 IS_VERCEL = bool(os.environ.get('VERCEL'))
+
+# Cold-start mode (default on Vercel): defer every optional import and all
+# filesystem writes until a request needs them.
+COLD_START = os.environ.get('COLD_START', '1' if IS_VERCEL else '0') == '1'
 GITHUB_LFS_BASE = os.environ.get(
     'AUDIO_BASE_URL',
     'https://media.githubusercontent.com/media/z4bryy/Leakify/main/Leakify-music-src'
@@ -117,11 +480,19 @@ app.config['SESSION_COOKIE_NAME']       = '_lx'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=12)
 
 # ── IP-based brute-force protection ────────────────────────
-# {ip: {'count': int, 'locked_until': float, 'window_start': float}}
-_LOGIN_ATTEMPTS: dict = defaultdict(lambda: {'count': 0, 'locked_until': 0.0, 'window_start': 0.0})
+# Failures per IP live in a ratelimit store: in-process by default, or shared
+# by every worker/instance via RATE_LIMIT_URL (sqlite:///<path> or redis://…).
 _MAX_ATTEMPTS    = 5     # failures before lockout
 _LOCKOUT_SECONDS = 60    # lockout duration in seconds
 _ATTEMPT_WINDOW  = 300   # rolling window; older failures are forgiven
+RATE_LIMIT_URL         = os.environ.get('RATE_LIMIT_URL', 'memory://')
+RATE_LIMIT_MAX_ENTRIES = int(os.environ.get('RATE_LIMIT_MAX_ENTRIES', '10000'))
+
+@lru_cache(maxsize=1)
+def _login_attempts():
+    """The attempt store, opened on first login so importing the app writes nothing."""
+    return open_attempt_store(RATE_LIMIT_URL, _MAX_ATTEMPTS, _ATTEMPT_WINDOW, _LOCKOUT_SECONDS,
+                              max_entries=RATE_LIMIT_MAX_ENTRIES, logger=app.logger)
 
 # ── Security response headers ───────────────────────────────
 @app.after_request
@@ -174,68 +545,67 @@ ARTIST_FOLDERS = [
     "D4vd",
 ]
 
+# Incremental index of MUSIC_FOLDER — rescans only list folders whose mtime changed
+_library = LibraryIndex(MUSIC_FOLDER, exts=('.mp3',))
+
 # Create folders if they don't exist (skipped on read-only serverless filesystems)
-try:
-    for folder in [MUSIC_FOLDER, VIDEO_FOLDER]:
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-
-    for artist in ARTIST_FOLDERS:
-        artist_dir = os.path.join(MUSIC_FOLDER, artist)
-        if not os.path.exists(artist_dir):
-            os.makedirs(artist_dir)
-except OSError:
-    pass
+def create_folders():
+    try:
+        for folder in [MUSIC_FOLDER, VIDEO_FOLDER]:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+        for artist in ARTIST_FOLDERS:
+            artist_dir = os.path.join(MUSIC_FOLDER, artist)
+            if not os.path.exists(artist_dir):
+                os.makedirs(artist_dir)
+    except OSError:
+        pass
 
 # Generate placeholder PNG icons if Pillow is available (skipped on read-only serverless)
 def generate_icons():
+    missing = [size for size in [192, 512, 1024]
+               if not os.path.exists(os.path.join('static', f'icon-{size}.png'))]
+    if not missing:
+        return   # the usual case: the icons are committed, so Pillow is never imported
     try:
         from PIL import Image, ImageDraw
-        for size in [192, 512, 1024]:
+        for size in missing:
             path = os.path.join('static', f'icon-{size}.png')
-            if not os.path.exists(path):
-                img = Image.new('RGB', (size, size), color=(6, 0, 8))
-                draw = ImageDraw.Draw(img)
-                # Full-bleed purple circle — fills entire canvas (maskable safe zone = center 80%)
-                margin = size // 32  # ~3% — effectively edge-to-edge
-                draw.ellipse([margin, margin, size - margin, size - margin], fill=(191, 90, 242))
-                # Dark inner circle to create a ring; then draw play triangle
-                ring_w = max(size // 10, 8)   # ring thickness ~10% of icon
-                inner_m = margin + ring_w
-                draw.ellipse([inner_m, inner_m, size - inner_m, size - inner_m], fill=(6, 0, 8))
-                # Play button triangle (centered)
-                cx, cy = size // 2, size // 2
-                tri_r = size // 5
-                pts = [
-                    (cx - tri_r // 2, cy - tri_r),
-                    (cx - tri_r // 2, cy + tri_r),
-                    (cx + tri_r, cy),
-                ]
-                draw.polygon(pts, fill=(191, 90, 242))
-                img.save(path)
+            img = Image.new('RGB', (size, size), color=(6, 0, 8))
+            draw = ImageDraw.Draw(img)
+            # Full-bleed purple circle — fills entire canvas (maskable safe zone = center 80%)
+            margin = size // 32  # ~3% — effectively edge-to-edge
+            draw.ellipse([margin, margin, size - margin, size - margin], fill=(191, 90, 242))
+            # Dark inner circle to create a ring; then draw play triangle
+            ring_w = max(size // 10, 8)   # ring thickness ~10% of icon
+            inner_m = margin + ring_w
+            draw.ellipse([inner_m, inner_m, size - inner_m, size - inner_m], fill=(6, 0, 8))
+            # Play button triangle (centered)
+            cx, cy = size // 2, size // 2
+            tri_r = size // 5
+            pts = [
+                (cx - tri_r // 2, cy - tri_r),
+                (cx - tri_r // 2, cy + tri_r),
+                (cx + tri_r, cy),
+            ]
+            draw.polygon(pts, fill=(191, 90, 242))
+            img.save(path)
     except (ImportError, OSError):
         pass
 
-generate_icons()
-
 @app.route('/api/login', methods=['POST'])
 def login():
     """Server-side credential check with IP brute-force protection."""
     ip  = request.headers.get('X-Forwarded-For', request.remote_addr or 'unknown').split(',')[0].strip()
-    now = time.time()
-    rec = _LOGIN_ATTEMPTS[ip]
+    attempts = _login_attempts()
 
     # ── Lockout check ──
-    if rec['locked_until'] > now:
-        remaining = int(rec['locked_until'] - now)
+    remaining = attempts.locked(ip)
+    if remaining:
         return jsonify({'ok': False, 'error': f'Too many attempts. Try again in {remaining}s.',
                         'locked': True, 'remaining': remaining}), 429
 
-    # Reset counter if outside the rolling window
-    if now - rec['window_start'] > _ATTEMPT_WINDOW:
-        rec['count'] = 0
-        rec['window_start'] = now
-
     # ── Credential check ──
     expected_user = os.environ.get('LOGIN_USER', '')
     expected_pass = os.environ.get('LOGIN_PASS', '')
@@ -248,7 +618,7 @@ def login():
 
     if user_ok and pass_ok:
         # Clear brute-force record and regenerate session to prevent fixation
-        _LOGIN_ATTEMPTS.pop(ip, None)
+        attempts.reset(ip)
         session.clear()
         session['authed']     = True
         session['csrf_token'] = secrets.token_hex(32)  # rotate CSRF token post-login
@@ -256,21 +626,22 @@ def login():
         return jsonify({'ok': True})
 
     # ── Failed attempt ──
-    rec['count'] += 1
-    if rec['count'] >= _MAX_ATTEMPTS:
-        rec['locked_until'] = now + _LOCKOUT_SECONDS
-        rec['count']        = 0
+    count, locked = attempts.record_failure(ip)
+    if locked:
         return jsonify({'ok': False, 'error': f'Too many failed attempts. Locked for {_LOCKOUT_SECONDS}s.',
                         'locked': True, 'remaining': _LOCKOUT_SECONDS}), 429
 
-    attempts_left = _MAX_ATTEMPTS - rec['count']
+    attempts_left = _MAX_ATTEMPTS - count
     return jsonify({'ok': False, 'error': 'Access denied', 'attemptsLeft': attempts_left}), 401
 
 
 @app.route('/api/debug')
 def debug_info():
-    """Shows server config state for debugging — no auth needed for diagnostics."""
-    import sys
+    """Shows server config state for debugging — no auth needed for diagnostics.
+
+    Internal state (cache/pool stats, timings, last upstream errors) is only
+    included for a logged-in session or `Authorization: Bearer $METRICS_TOKEN`.
+    """
     sb_ok = False
     sb_err = None
     if USE_SUPABASE:
@@ -280,7 +651,7 @@ def debug_info():
             sb_err = f'listed {len(items)} root items'
         except Exception as e:
             sb_err = str(e)
-    return jsonify({
+    info = {
         'use_supabase':    USE_SUPABASE,
         'supabase_ok':     sb_ok,
         'supabase_error':  sb_err,
@@ -292,7 +663,20 @@ def debug_info():
         'secret_key_set':  bool(os.environ.get('SECRET_KEY')),
         'is_vercel':       IS_VERCEL,
         'python':          sys.version,
-    })
+    }
+    if _operator_authorized():
+        info.update({
+            'lazy_signing':     LAZY_SIGNING,
+            'catalog_cache':    _catalog.stats(),
+            'supabase_walk':    _sb_last_walk,
+            'supabase_sign':    _sb_last_sign,
+            'signed_urls':      _signed_urls.stats(),
+            'http_pool':        _http.stats(),
+            'splash_cache':     _splash_cache.stats(),
+            'startup':          _startup,
+            'login_rate_limit': _login_attempts().stats(),
+        })
+    return jsonify(info)
 
 @app.route('/favicon.ico')
 def favicon():
@@ -323,132 +707,58 @@ def service_worker():
     response.headers['Cache-Control'] = 'no-cache, must-revalidate'
     return response
 
-@app.route('/api/songs')
-@require_auth
-def get_songs():
-    """Get all songs from the music library with smart deduplication.
-
-    In Supabase mode: list files recursively from the bucket and generate
-    1-hour signed URLs.  Artist is derived from the top-level folder in the
-    bucket path; root-level files (no folder) are assigned to 'JuiceWrld'.
-
-    In local/fallback mode: scan Leakify-music-src/ on disk (original logic).
-    Priority: Remasters(4) > LEAKED(3) > Session Edits(2) > Extras(1) > root(0)
-    """
-
-    SUBFOLDER_PRIORITY = {
-        'remasters':     (4, 'REMASTER'),
-        'leaked':        (3, 'LEAKED'),
-        'session edits': (2, 'SESSION'),
-        'extras':        (1, 'EXTRA'),
-    }
-
-    # Manual artist corrections — keyed by lowercased display name (no extension).
-    # Use this when a file is stored in the wrong bucket folder.
-    ARTIST_OVERRIDES = {
-        'agc overseas':       'Ken Carson',
-        'for u mars':         'Ken Carson',
-        'chrome hearts':      'Ken Carson',
-        'i need u(coachella)': 'Ken Carson',
-        'margiela':           'Ken Carson',
+# ── Catalog building ───────────────────────────────────────
+# Priority: Remasters(4) > LEAKED(3) > Session Edits(2) > Extras(1) > root(0)
+SUBFOLDER_PRIORITY = {
+    'remasters':     (4, 'REMASTER'),
+    'leaked':        (3, 'LEAKED'),
+    'session edits': (2, 'SESSION'),
+    'extras':        (1, 'EXTRA'),
+}
+
+# Manual artist corrections — keyed by lowercased display name (no extension).
+# Use this when a file is stored in the wrong bucket folder.
+ARTIST_OVERRIDES = {
+    'agc overseas':       'Ken Carson',
+    'for u mars':         'Ken Carson',
+    'chrome hearts':      'Ken Carson',
+    'i need u(coachella)': 'Ken Carson',
+    'margiela':           'Ken Carson',
+}
+
+def _raw_track(rel_path, root_artist):
+    """Describe one library file; `root_artist` is used for files with no folder."""
+    parts = rel_path.split('/')
+    if len(parts) == 1:
+        artist    = root_artist
+        sub_parts = []
+    else:
+        artist    = parts[0]
+        sub_parts = parts[1:-1]
+
+    filename     = parts[-1]
+    display_name = os.path.splitext(filename)[0]
+    sub_key      = sub_parts[0].strip().lower() if sub_parts else ""
+    pri, tag     = SUBFOLDER_PRIORITY.get(sub_key, (0, "LEAKED"))
+    return {
+        "display":   display_name,
+        "filename":  rel_path,
+        "artist":    ARTIST_OVERRIDES.get(display_name.strip().lower(), artist),
+        "subfolder": "/".join(sub_parts),
+        "tag":       tag,
+        "_priority": pri,
+        "_norm":     display_name.strip().lower(),
     }
 
-    AUDIO_EXTS = {'.mp3', '.m4a', '.wav', '.flac', '.ogg'}
-
-    # ── Supabase mode ────────────────────────────────────────────────────
-    if USE_SUPABASE:
-        try:
-            all_paths = _sb_list_recursive('')
-        except Exception as e:
-            all_paths = []
-
-        raw = []
-        for path in all_paths:
-            parts = path.split('/')
-            if len(parts) == 1:
-                artist    = SUPABASE_BUCKET
-                sub_parts = []
-            else:
-                artist    = parts[0]
-                sub_parts = parts[1:-1]
-
-            filename     = parts[-1]
-            display_name = os.path.splitext(filename)[0]
-            subfolder    = "/".join(sub_parts)
-            sub_key      = sub_parts[0].strip().lower() if sub_parts else ""
-            pri, tag     = SUBFOLDER_PRIORITY.get(sub_key, (0, "LEAKED"))
-            artist       = ARTIST_OVERRIDES.get(display_name.strip().lower(), artist)
-
-            raw.append({
-                "display":   display_name,
-                "filename":  path,
-                "artist":    artist,
-                "subfolder": subfolder,
-                "tag":       tag,
-                "_priority": pri,
-                "_norm":     display_name.strip().lower(),
-            })
-
-        by_artist = defaultdict(list)
-        for s in raw:
-            by_artist[s["artist"]].append(s)
-
-        songs = []
-        for artist, tracks in by_artist.items():
-            best = {}
-            for t in tracks:
-                key = t["_norm"]
-                if key not in best or t["_priority"] > best[key]["_priority"]:
-                    best[key] = t
-            for t in sorted(best.values(), key=lambda x: x["display"].lower()):
-                songs.append({
-                    "display":   t["display"],
-                    "filename":  t["filename"],
-                    "artist":    t["artist"],
-                    "subfolder": t["subfolder"],
-                    "tag":       t["tag"],
-                    "url":       "",
-                })
-
-        songs.sort(key=lambda s: (s["artist"].lower(), s["display"].lower()))
+def _dedup_key(t):
+    """Lowest key wins: highest priority, then shallowest path, then path order.
 
-        try:
-            url_map = _sb_signed_urls([s["filename"] for s in songs])
-            for s in songs:
-                s["url"] = url_map.get(s["filename"], "")
-        except Exception as sign_err:
-            # Signing failed — leave URLs empty; client will fetch via /api/song-url
-            app.logger.error(f'Supabase batch sign failed: {sign_err}')
-
-        return jsonify({"songs": songs, "count": len(songs)})
-
-    # ── Local / GitHub-LFS fallback ──────────────────────────────────────
-    raw = []
-    for root_dir, dirs, files in os.walk(MUSIC_FOLDER):
-        dirs.sort()
-        for file in sorted(files):
-            if not file.lower().endswith('.mp3'):
-                continue
-            full_path = os.path.join(root_dir, file)
-            rel_path  = os.path.relpath(full_path, MUSIC_FOLDER).replace("\\", "/")
-            parts     = rel_path.split("/")
-            artist    = parts[0] if len(parts) >= 1 else "Unsorted"
-            sub_parts = parts[1:-1]
-            subfolder = "/".join(sub_parts)
-            display_name = os.path.splitext(file)[0]
-            sub_key  = sub_parts[0].strip().lower() if sub_parts else ""
-            pri, tag = SUBFOLDER_PRIORITY.get(sub_key, (0, "LEAKED"))
-            artist   = ARTIST_OVERRIDES.get(display_name.strip().lower(), artist)
-            raw.append({
-                "display":   display_name,
-                "filename":  rel_path,
-                "artist":    artist,
-                "subfolder": subfolder,
-                "tag":       tag,
-                "_priority": pri,
-                "_norm":     display_name.strip().lower(),
-            })
+    Independent of arrival order, so parallel listings dedup deterministically.
+    """
+    return (-t["_priority"], t["filename"].count('/'), t["filename"])
 
+def _dedup_tracks(raw, url_for):
+    """Keep the highest-priority copy of each (artist, title); sorted by artist, title."""
     by_artist = defaultdict(list)
     for s in raw:
         by_artist[s["artist"]].append(s)
@@ -458,53 +768,817 @@ def get_songs():
         best = {}
         for t in tracks:
             key = t["_norm"]
-            if key not in best or t["_priority"] > best[key]["_priority"]:
+            if key not in best or _dedup_key(t) < _dedup_key(best[key]):
                 best[key] = t
-        for t in sorted(best.values(), key=lambda x: x["display"].lower()):
-            if IS_VERCEL:
-                audio_url = f"{GITHUB_LFS_BASE}/{urlquote(t['filename'], safe='/')}"
-            else:
-                audio_url = f"/play/{urlquote(t['filename'], safe='/')}"
+        for t in best.values():
             songs.append({
                 "display":   t["display"],
                 "filename":  t["filename"],
                 "artist":    t["artist"],
                 "subfolder": t["subfolder"],
                 "tag":       t["tag"],
-                "url":       audio_url,
+                "url":       url_for(t["filename"]),
             })
 
-    songs.sort(key=lambda s: (s["artist"].lower(), s["display"].lower()))
-    return jsonify({"songs": songs, "count": len(songs)})
+    songs.sort(key=_sort_key)
+    return songs
+
+def _sort_key(s):
+    """Catalog order: artist, title, then path so every track has a unique position."""
+    return (s["artist"].lower(), s["display"].lower(), s["filename"])
+
+class _CatalogUnavailable(Exception):
+    """The track listing could not be fetched; the previous catalog stays in use."""
+
+def _attach_urls(songs, url_map):
+    """Set each song's signed URL from `url_map` (None if batch signing failed).
+
+    Paths that could not be signed keep a URL still cached from an earlier
+    build, or stay empty; the client fetches those via /api/song-url.
+    """
+    url_map, now = url_map or {}, time.time()
+    for s in songs:
+        url = url_map.get(s["filename"])
+        if not url:
+            cached = _signed_urls.peek(s["filename"])
+            url    = cached[0] if cached and cached[1] > now else ""
+        s["url"] = url
+
+def _build_catalog():
+    """Build the deduplicated song list from Supabase or the local library.
+
+    In Supabase mode: list files recursively from the bucket and generate
+    signed URLs.  Artist is derived from the top-level folder in the
+    bucket path; root-level files (no folder) are assigned to the bucket name.
+
+    In local/fallback mode: scan Leakify-music-src/ on disk.
+    """
+    # ── Supabase mode ────────────────────────────────────────────────────
+    if USE_SUPABASE:
+        try:
+            # Dedup consumes the walk as folders finish listing
+            with _catalog_phase_seconds.time('walk_dedup'):
+                songs = _dedup_tracks((_raw_track(path, SUPABASE_BUCKET) for path in _sb_walk('')),
+                                      lambda _path: "")
+        except Exception as e:
+            # Let the cache keep serving the previous catalog instead of an empty one
+            raise _CatalogUnavailable(f'Supabase listing failed: {e}') from e
+
+        _attach_analysis(songs)
+        if LAZY_SIGNING:
+            return songs   # URLs are signed on demand via /api/sign
+        try:
+            with _catalog_phase_seconds.time('sign'):
+                url_map = _signed_urls.get_many([s["filename"] for s in songs])
+        except Exception as sign_err:
+            app.logger.error(f'Supabase batch sign failed: {sign_err}')
+            url_map = None
+        _attach_urls(songs, url_map)
+        return songs
+
+    # ── Local / GitHub-LFS fallback ──────────────────────────────────────
+    with _catalog_phase_seconds.time('scan'):
+        diff = _library.scan()
+    if any(diff):
+        app.logger.info(f'Library: +{len(diff.added)} -{len(diff.removed)} ~{len(diff.changed)}')
+    files = _library.signatures()
+    raw   = [_raw_track(rel_path, "Unsorted") for rel_path in sorted(files)]
+
+    with _catalog_phase_seconds.time('dedup'):
+        if IS_VERCEL:
+            return _dedup_tracks(raw, lambda p: f"{GITHUB_LFS_BASE}/{urlquote(p, safe='/')}")
+        songs = _dedup_tracks(raw, lambda p: f"/play/{urlquote(p, safe='/')}")
+    for s in songs:
+        meta = _metadata.get(s["filename"], files[s["filename"]])
+        if meta:
+            s["meta"] = meta
+    _attach_analysis(songs, files)
+    if not COLD_START:
+        _index_metadata_async(files)
+        _analyze_async(files)
+    return songs
+
+# ── Audio metadata ─────────────────────────────────────────
+# Duration/bitrate/tags for local tracks are read in a background process
+# pool and cached by (path, size, mtime) in METADATA_DB, which the desktop
+# player shares. The catalog is rebuilt once new metadata has landed.
+METADATA_DB      = os.environ.get('METADATA_DB', os.path.join('.cache', 'metadata.db'))
+METADATA_WORKERS = int(os.environ.get('METADATA_WORKERS', '0')) or None
+
+_metadata      = MetadataIndex(MUSIC_FOLDER, METADATA_DB, workers=METADATA_WORKERS)
+_metadata_busy = threading.Lock()
+
+def _index_metadata_async(files):
+    """Index new/changed tracks off the request thread; no-op if already running."""
+    if not _metadata.stale(files) or not _metadata_busy.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            if _metadata.update(files):
+                _catalog.invalidate()
+        except Exception as e:
+            app.logger.error(f'Metadata indexing failed: {e}')
+        finally:
+            _metadata_busy.release()
+
+    threading.Thread(target=run, name='metadata-index', daemon=True).start()
+
+# ── Audio analysis ─────────────────────────────────────────
+# Waveform peaks and loudness (analysis.py) for local tracks are computed in
+# a background process pool after catalog builds and kept under ANALYSIS_DIR.
+# Peaks are served from /api/peaks/<path>; loudness becomes each song's
+# `gain_db`, the playback gain that brings it to LOUDNESS_TARGET LUFS.
+# Embedded cover art is extracted alongside into WebP thumbnails under
+# ART_DIR, served from /art/<hash>-<size>.webp; songs with art carry its
+# hash as `art`. `python app.py analyze` runs the same jobs at build time,
+# so instances without the audio can serve all of it too.
+ANALYSIS_DIR     = os.environ.get('ANALYSIS_DIR', os.path.join('.cache', 'analysis'))
+ART_DIR          = os.environ.get('ART_DIR', os.path.join('.cache', 'art'))
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', '0')) or None
+LOUDNESS_TARGET  = float(os.environ.get('LOUDNESS_TARGET', '-14'))
+
+_analysis      = AnalysisIndex(MUSIC_FOLDER, ANALYSIS_DIR, workers=ANALYSIS_WORKERS)
+_art           = ArtIndex(MUSIC_FOLDER, ART_DIR, workers=ANALYSIS_WORKERS)
+_analysis_busy = threading.Lock()
+
+def _attach_analysis(songs, files=None):
+    """Set `gain_db` and `art` on songs that have them (at their current signature, if known)."""
+    for s in songs:
+        sig      = files[s["filename"]] if files else None
+        measured = _analysis.loudness(s["filename"], sig)
+        gain     = gain_db(*measured, LOUDNESS_TARGET) if measured else None
+        if gain is not None:
+            s["gain_db"] = gain
+        art = _art.lookup(s["filename"], sig)
+        if art:
+            s["art"] = art
+
+def _analyze_async(files):
+    """Analyse new/changed tracks off the request thread; no-op if already running."""
+    stages = [index for index in (_analysis, _art) if index.stale(files)]
+    if not stages or not _analysis_busy.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            changed = 0
+            for index in stages:
+                try:
+                    changed += index.update(files)
+                except AnalysisUnavailable:
+                    pass
+            if changed:
+                _catalog.invalidate()
+        except Exception as e:
+            app.logger.error(f'Audio analysis failed: {e}')
+        finally:
+            _analysis_busy.release()
+
+    threading.Thread(target=run, name='audio-analysis', daemon=True).start()
+
+# ── Precompressed JSON responses ───────────────────────────
+# A catalog body is hashed once for a strong ETag and each compressed
+# variant is produced at most once per catalog version, so repeat loads
+# cost a 304 or a memcpy of cached gzip/brotli bytes.
+class _Payload:
+    """Immutable response body with a content-hash ETag and memoised encodings."""
+
+    def __init__(self, body):
+        self.body     = body
+        self.etag     = hashlib.sha256(body).hexdigest()[:32]
+        self._encoded = {'identity': body}
+        self._derived = {}
+        self._lock    = threading.Lock()
+
+    def derived(self, key, build):
+        """Another _Payload from the same data (e.g. another format), built at most once."""
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = _Payload(build())
+            return self._derived[key]
+
+    @staticmethod
+    def encodings():
+        """Supported codings, most preferred first."""
+        return ('br', 'gzip', 'identity') if _brotli() else ('gzip', 'identity')
+
+    def tag(self, encoding):
+        """Strong ETag of one representation (each coding is its own representation)."""
+        return self.etag if encoding == 'identity' else f'{self.etag}-{encoding}'
+
+    def encoded(self, encoding):
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == 'br':
+                    self._encoded[encoding] = _brotli().compress(self.body, quality=9)
+                else:
+                    self._encoded[encoding] = gzip.compress(self.body, compresslevel=9, mtime=0)
+            return self._encoded[encoding]
+
+def _send_payload(payload, mimetype='application/json'):
+    """Send `payload` in the best coding the client accepts, or 304 if it is current."""
+    encoding = request.accept_encodings.best_match(payload.encodings(), default='identity')
+    if any(request.if_none_match.contains_weak(payload.tag(e)) for e in payload.encodings()):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(payload.encoded(encoding), mimetype=mimetype)
+        if encoding != 'identity':
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(payload.tag(encoding))
+    resp.vary.add('Accept-Encoding')
+    # Per-user data: browsers may keep it but must revalidate every time
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+# ── Catalog snapshot ───────────────────────────────────────
+# The last built catalog is saved to SQLite so a new process (Vercel cold
+# start, server restart) serves it straight away and rebuilds in the
+# background. `python app.py snapshot` writes CATALOG_SNAPSHOT at build time
+# for deployments whose filesystem is read-only apart from /tmp.
+CATALOG_DB = os.environ.get(
+    'CATALOG_DB',
+    '/tmp/leakify-catalog.db' if IS_VERCEL else os.path.join('.cache', 'catalog.db'))
+CATALOG_SNAPSHOT = os.environ.get(
+    'CATALOG_SNAPSHOT',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.snapshot.db'))
+
+_catalog_store = CatalogStore(CATALOG_DB, readonly_path=CATALOG_SNAPSHOT)
+
+def _catalog_source():
+    """Which builder produced a catalog; snapshots from another mode are ignored."""
+    if USE_SUPABASE:
+        return f'supabase:{SUPABASE_URL}/{SUPABASE_BUCKET}'
+    return 'lfs' if IS_VERCEL else 'local'
+
+def _save_snapshot(songs, version=None):
+    """Persist the catalog with each track's priority and signed-URL expiry."""
+    rows = []
+    for s in songs:
+        sub_key = s["subfolder"].split('/')[0].strip().lower()
+        cached  = _signed_urls.peek(s["filename"]) if USE_SUPABASE else None
+        rows.append({**s,
+                     'priority':    SUBFOLDER_PRIORITY.get(sub_key, (0, ''))[0],
+                     'url_expires': cached[1] if cached else 0.0})
+    return _catalog_store.save(rows, version=version, source=_catalog_source())
+
+def _load_snapshot():
+    """Return (songs, meta) from the snapshot, or None if absent or from another mode.
+
+    Signed URLs still inside their safety margin are reused (and seed the
+    signed-URL cache); the rest are blanked so the client falls back to /play.
+    """
+    loaded = _catalog_store.load()
+    if not loaded or loaded[1].get('source') != _catalog_source():
+        return None
+    rows, meta = loaded
+    songs, still_valid, now = [], {}, time.time()
+    for r in rows:
+        url = r['url']
+        if USE_SUPABASE:
+            if url and r['url_expires'] - SIGNED_URL_MARGIN > now:
+                still_valid[r['filename']] = (url, r['url_expires'])
+            else:
+                url = ''
+        song = {k: r[k] for k in ('display', 'filename', 'artist', 'subfolder', 'tag')} | {'url': url}
+        if r['meta']:
+            song['meta'] = r['meta']
+        if r.get('gain_db') is not None:
+            song['gain_db'] = r['gain_db']
+        if r.get('art'):
+            song['art'] = r['art']
+        songs.append(song)
+    _signed_urls.seed(still_valid)
+    return songs, meta
+
+# ── Catalog cache ──────────────────────────────────────────
+# Building the catalog walks the whole bucket (or disk) and re-signs every URL,
+# so the result — and its serialised JSON body — is shared by every request
+# until CATALOG_TTL seconds pass or the cache is explicitly invalidated.
+CATALOG_TTL = int(os.environ.get('CATALOG_TTL', '300'))
+
+# Stale-while-revalidate: an expired catalog is still served, while one
+# rebuild runs in the background, for up to CATALOG_MAX_STALE seconds past
+# its TTL (kept under SIGNED_URL_MARGIN so its signed URLs are still valid).
+# A failed rebuild keeps the previous catalog and is retried after
+# CATALOG_RETRY_SECONDS. Outside serverless mode a refresher thread also
+# rebuilds every CATALOG_REFRESH_INTERVAL seconds (0 = off), re-signing URLs
+# that are near expiry, so requests rarely meet an expired catalog at all.
+CATALOG_MAX_STALE        = int(os.environ.get('CATALOG_MAX_STALE', str(SIGNED_URL_MARGIN // 2)))
+CATALOG_RETRY_SECONDS    = int(os.environ.get('CATALOG_RETRY_SECONDS', '30'))
+CATALOG_REFRESH_INTERVAL = int(os.environ.get('CATALOG_REFRESH_INTERVAL', str(CATALOG_TTL * 4 // 5)))
+
+# Versions are millisecond build stamps, so catalogs built independently by
+# different instances do not share a version number; /api/songs?since=<v>
+# returns the changes logged since v, for up to CATALOG_HISTORY builds back.
+CATALOG_HISTORY    = int(os.environ.get('CATALOG_HISTORY', '32'))
+DELTA_MAX_FRACTION = 0.5
+
+def _next_version(current):
+    return max(current + 1, int(time.time() * 1000))
+
+class _CatalogCache:
+    """Process-wide, thread-safe cache of the built song list."""
+
+    def __init__(self, ttl):
+        self.ttl             = ttl
+        self.songs           = None
+        self.payload         = None   # precomputed /api/songs body (_Payload)
+        self.version         = 0      # ms timestamp of the first build of this content
+        self._changes        = deque(maxlen=CATALOG_HISTORY)  # [(from_version, to_version, {fn: song}, {fn})]
+        self.built_at        = 0.0
+        self.build_seconds   = 0.0
+        self.hits            = 0
+        self.misses          = 0
+        self.invalidations   = 0
+        self.snapshot_loads  = 0
+        self.stale_served    = 0
+        self.failures        = 0
+        self.last_error      = None
+        self._snapshot_tried = False
+        self._refreshing     = False
+        self._lock           = threading.Lock()
+        self._build_lock     = threading.Lock()
+
+    def _fresh(self, now):
+        return self.payload is not None and now - self.built_at < self.ttl
+
+    def _install(self, songs, built_at, version=None):
+        """Swap in a new song list, bumping the version and logging what changed.
+
+        `version` is used for the first install (e.g. from a snapshot); after
+        that the version only moves when a track was added, removed or changed
+        (including its signed URL or metadata).
+        """
+        new = {s["filename"]: s for s in songs}
+        if self.songs is None:
+            self.version = version or _next_version(self.version)
+        else:
+            old     = {s["filename"]: s for s in self.songs}
+            changed = {fn: s for fn, s in new.items() if old.get(fn) != s}
+            removed = set(old) - set(new)
+            if changed or removed:
+                v = _next_version(self.version)
+                self._changes.append((self.version, v, changed, removed))
+                self.version = v
+        with _catalog_phase_seconds.time('index'):
+            _search.update(songs)
+        self.songs    = songs
+        with _catalog_phase_seconds.time('encode'):
+            self.payload = _Payload(json.dumps({"songs": songs, "count": len(songs), "version": self.version},
+                                               separators=(',', ':')).encode())
+        self.built_at = built_at
+
+    def _servable(self, now, refresh=None):
+        """True if the current catalog can be returned now. Caller holds _lock.
+
+        An expired catalog still within CATALOG_MAX_STALE is served while
+        `refresh` (default: a background thread) rebuilds it.
+        """
+        if self._fresh(now) or (self.payload is not None and self._refreshing):
+            return True
+        if self.payload is not None and now - self.built_at < self.ttl + CATALOG_MAX_STALE:
+            self.stale_served += 1
+            (refresh or self._refresh_async)()
+            return True
+        return False
+
+    def _rebuild(self):
+        """Build, install and persist a new catalog. Caller holds _build_lock."""
+        t0 = time.perf_counter()
+        try:
+            songs = _build_catalog()
+        except _CatalogUnavailable as e:
+            return self.keep_previous(e)
+        return self.commit(songs, t0)
+
+    def keep_previous(self, err):
+        """Record a failed build and keep serving the last good catalog.
+
+        With nothing to fall back on an empty catalog is served. Either way
+        the next attempt waits CATALOG_RETRY_SECONDS instead of every request
+        hitting the failing backend.
+        """
+        app.logger.error(f'Catalog build failed, keeping the previous catalog: {err}')
+        now = time.time()
+        with self._lock:
+            self.failures  += 1
+            self.last_error = str(err)
+            if self.payload is None:
+                self._install([], now)
+            self.built_at = now - max(self.ttl - CATALOG_RETRY_SECONDS, 0)
+            return self.songs, self.payload
+
+    def commit(self, songs, t0):
+        """Install a song list built since perf_counter() `t0`, and persist it."""
+        with self._lock:
+            self._install(songs, time.time())
+            self.build_seconds = time.perf_counter() - t0
+            songs, payload, version = self.songs, self.payload, self.version
+        _save_snapshot(songs, version)
+        return songs, payload
+
+    def delta(self, since):
+        """Return (version, {fn: song} changed/added, {fn} removed) since `since`.
+
+        Returns None when a full snapshot is cheaper or required: `since` is
+        unknown (another instance, or older than CATALOG_HISTORY builds) or
+        the accumulated changes exceed DELTA_MAX_FRACTION of the catalog.
+        """
+        with self._lock:
+            if since == self.version:
+                return self.version, {}, set()
+            entries = list(self._changes)
+            start   = next((i for i, e in enumerate(entries) if e[0] == since), None)
+            if start is None:
+                return None
+            changed, removed = {}, set()
+            for _from, _to, ch, rm in entries[start:]:
+                for fn in rm:
+                    changed.pop(fn, None)
+                    removed.add(fn)
+                for fn, song in ch.items():
+                    removed.discard(fn)
+                    changed[fn] = song
+            if len(changed) + len(removed) > DELTA_MAX_FRACTION * max(len(self.songs), 1):
+                return None
+            return self.version, changed, removed
+
+    def _refresh_async(self):
+        """Rebuild in a background thread, serving the current catalog meanwhile."""
+        self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                app.logger.error(f'Background catalog refresh failed: {e}')
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='catalog-refresh', daemon=True).start()
+
+    def refresh(self):
+        """Rebuild now, after any build already in progress."""
+        with self._build_lock:
+            return self._rebuild()
+
+    def _load_snapshot(self, refresh=None):
+        """Seed an empty cache from the on-disk snapshot (first request only).
+
+        A stale snapshot is refreshed with `refresh` (default: a background thread).
+        """
+        self._snapshot_tried = True
+        snap = _load_snapshot()
+        if snap:
+            songs, meta = snap
+            self._install(songs, float(meta.get('saved_at', 0)), int(meta['version']))
+            self.snapshot_loads += 1
+            if not self._fresh(time.time()):
+                (refresh or self._refresh_async)()
+
+    def get(self):
+        """Return (songs, payload), rebuilding at most once when empty or expired."""
+        with self._lock:
+            if self.payload is None and not self._snapshot_tried:
+                self._load_snapshot()
+            if self._servable(time.time()):
+                self.hits += 1
+                return self.songs, self.payload
+            self.misses += 1
+        # One build at a time; requests that waited on it reuse the result
+        with self._build_lock:
+            with self._lock:
+                if self._fresh(time.time()):
+                    return self.songs, self.payload
+            return self._rebuild()
+
+    def invalidate(self):
+        """Expire the cached catalog; the next request rebuilds it.
+
+        The current songs are kept so the rebuild can be diffed for deltas.
+        """
+        with self._lock:
+            self.built_at = 0.0
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits':           self.hits,
+                'misses':         self.misses,
+                'hit_ratio':      round(self.hits / total, 4) if total else 0.0,
+                'invalidations':  self.invalidations,
+                'snapshot_loads': self.snapshot_loads,
+                'stale_served':   self.stale_served,
+                'failures':       self.failures,
+                'last_error':     self.last_error,
+                'version':        self.version,
+                'ttl':            self.ttl,
+                'cached':         self.payload is not None,
+                'age':            round(time.time() - self.built_at, 1) if self.payload is not None else None,
+                'build_seconds':  round(self.build_seconds, 4),
+                'count':          len(self.songs) if self.songs is not None else 0,
+            }
+
+_catalog = _CatalogCache(CATALOG_TTL)
+
+def _catalog_refresher():
+    """Rebuild the catalog every CATALOG_REFRESH_INTERVAL seconds, ahead of its TTL."""
+    while True:
+        time.sleep(CATALOG_REFRESH_INTERVAL)
+        try:
+            _catalog.refresh()
+        except Exception as e:
+            app.logger.error(f'Catalog refresher: {e}')
+
+# Search index over the catalog; kept in sync incrementally on every install
+_search = SearchIndex()
+
+# SIGHUP drops the cache on servers that run us in the main thread (not on Windows).
+try:
+    signal.signal(signal.SIGHUP, lambda _sig, _frame: _catalog.invalidate())
+except (AttributeError, ValueError):
+    pass
+
+# ── /api/songs paging and streaming ────────────────────────
+# Cursors are opaque, URL-safe encodings of the last returned track's sort
+# key, so paging stays stable even if the catalog changes between pages.
+SONGS_PAGE_MAX  = 1000
+NDJSON_CHUNK    = 64     # tracks per streamed write
+
+def _encode_cursor(song):
+    return base64.urlsafe_b64encode(json.dumps(_sort_key(song)).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """Return the sort key encoded in `cursor`, or None if it is malformed."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not (isinstance(key, list) and len(key) == 3 and all(isinstance(k, str) for k in key)):
+        return None
+    return tuple(key)
+
+def _wants_ndjson():
+    return (request.args.get('format') == 'ndjson'
+            or 'application/x-ndjson' in request.headers.get('Accept', ''))
+
+def _ndjson_body(songs):
+    return ''.join(json.dumps(s, separators=(',', ':')) + '\n' for s in songs).encode()
+
+def _ndjson_response(songs, next_cursor=None):
+    """Stream one JSON track per line, written in small chunks as it is generated."""
+    def generate():
+        for i in range(0, len(songs), NDJSON_CHUNK):
+            yield ''.join(json.dumps(s, separators=(',', ':')) + '\n'
+                          for s in songs[i:i + NDJSON_CHUNK])
+    resp = app.response_class(generate(), mimetype='application/x-ndjson')
+    resp.headers['X-Total-Count'] = str(len(songs))
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
+
+@app.route('/api/songs')
+@require_auth
+def get_songs():
+    """Get all songs from the music library with smart deduplication (cached).
+
+    Query params (all optional):
+      since=<version>       only tracks changed/removed since that catalog version
+                            (a full snapshot if the gap is unknown or too large)
+      limit=<n>&cursor=<c>  page through the catalog in (artist, title) order
+      format=ndjson         stream one track per line (or Accept: application/x-ndjson)
+    """
+    songs, payload = _catalog.get()
+    resp = make_response(_songs_response(songs, payload))
+    resp.headers['X-Catalog-Version'] = str(_catalog.version)
+    return resp
+
+def _songs_response(songs, payload):
+    if 'since' in request.args:
+        try:
+            since = int(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'Invalid version'}), 400
+        delta = _catalog.delta(since)
+        if delta is None:
+            return _send_payload(payload)   # full snapshot: {"songs", "count", "version"}
+        version, changed, removed = delta
+        return jsonify({'version': version, 'since': since,
+                        'changed': sorted(changed.values(), key=_sort_key),
+                        'removed': sorted(removed)})
+
+    paged = 'limit' in request.args or 'cursor' in request.args
+    if not paged:
+        # Full loads come from the per-version payload in either format, so
+        # they get the cached gzip/brotli bytes and 304s
+        if _wants_ndjson():
+            resp = _send_payload(payload.derived('ndjson', lambda: _ndjson_body(songs)),
+                                 mimetype='application/x-ndjson')
+            resp.headers['X-Total-Count'] = str(len(songs))
+        else:
+            resp = _send_payload(payload)
+        resp.vary.add('Accept')
+        return resp
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', 200)), SONGS_PAGE_MAX))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    start = 0
+    if request.args.get('cursor'):
+        key = _decode_cursor(request.args['cursor'])
+        if key is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        start = bisect.bisect_right(songs, key, key=_sort_key)
+    total = len(songs)
+    songs = songs[start:start + limit]
+    next_cursor = _encode_cursor(songs[-1]) if start + limit < total and songs else None
+    if not _wants_ndjson():
+        return jsonify({'songs': songs, 'count': len(songs), 'total': total,
+                        'next_cursor': next_cursor})
+    return _ndjson_response(songs, next_cursor)
+
+@app.route('/api/search')
+@require_auth
+def search_songs():
+    """Ranked, typo-tolerant search over the catalog.
+
+    Query params: q=<text>  artist=<name>  tag=LEAKED|REMASTER|SESSION|EXTRA  limit=<n>
+    """
+    _catalog.get()   # make sure the index reflects the current catalog
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        limit = 50
+    t0 = time.perf_counter()
+    results, total = _search.search(request.args.get('q', ''),
+                                    artist=request.args.get('artist') or None,
+                                    tag=request.args.get('tag') or None,
+                                    limit=limit)
+    return jsonify({'songs': results, 'count': len(results), 'total': total,
+                    'took_ms': round((time.perf_counter() - t0) * 1000, 3)})
+
+@app.route('/api/catalog/refresh', methods=['POST'])
+@require_auth
+def refresh_catalog():
+    """Invalidate the catalog cache, e.g. after uploading new tracks."""
+    _catalog.invalidate()
+    return jsonify({'ok': True})
+
+@app.route('/api/catalog/stats')
+@require_auth
+def catalog_stats():
+    """Catalog and signed-URL cache hit/miss counters."""
+    return jsonify({**_catalog.stats(), 'signed_urls': _signed_urls.stats()})
 
 @app.route('/api/song-url')
 @require_auth
 def song_url():
-    """Return a fresh signed URL for a single Supabase file (used for error recovery)."""
+    """Return a signed URL for a single Supabase file (used for error recovery).
+
+    Pass refresh=1 to bypass the signed-URL cache and force a new signature.
+    """
     path = request.args.get('path', '')
     if not path or not USE_SUPABASE:
         return jsonify({'error': 'Not available'}), 404
     try:
-        url_map = _sb_signed_urls([path])
-        url = url_map.get(path, '')
+        url = _signed_urls.get(path, refresh=request.args.get('refresh') == '1')
         return jsonify({'url': url})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/sign', methods=['POST'])
+@require_auth
+def sign_urls():
+    """Sign a batch of tracks: {"paths": [...]} → {"urls": {path: url}}.
+
+    Used with LAZY_SIGNING for the tracks on screen and next in the queue.
+    Paths that could not be signed are left out; /play still works for them.
+    """
+    paths = (request.get_json(silent=True) or {}).get('paths')
+    if not isinstance(paths, list) or not all(isinstance(p, str) and p for p in paths):
+        return jsonify({'error': 'paths must be a list of file paths'}), 400
+    if len(paths) > SIGN_REQUEST_MAX:
+        return jsonify({'error': f'At most {SIGN_REQUEST_MAX} paths per request'}), 400
+    if not USE_SUPABASE:
+        return jsonify({'urls': {p: f"/play/{urlquote(p, safe='/')}" for p in paths}})
+    try:
+        urls = _signed_urls.get_many(paths)
+        return jsonify({'urls': {p: url for p, url in urls.items() if url}})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/peaks/<path:filename>')
+@require_auth
+def track_peaks(filename):
+    """Waveform peaks for one track, in the binary format of analysis.encode_peaks.
+
+    Local tracks not analysed yet are analysed on demand; elsewhere only
+    peaks computed at build time are available.
+    """
+    sig = None
+    if not USE_SUPABASE:
+        path = safe_join(MUSIC_FOLDER, filename)
+        if not path or not filename.lower().endswith(_library.exts) or not os.path.isfile(path):
+            return jsonify({'error': 'Not found'}), 404
+        st  = os.stat(path)
+        sig = (st.st_size, st.st_mtime_ns)
+    digest = _analysis.lookup(filename, sig)
+    if digest is None and sig is not None and _analysis.stale({filename: sig}):
+        try:
+            _analysis.update({filename: sig}, rels=[filename])
+        except AnalysisUnavailable:
+            pass
+        digest = _analysis.lookup(filename, sig)
+    data = _analysis.read(digest) if digest else None
+    if data is None:
+        return jsonify({'error': 'Not available'}), 404
+    if request.if_none_match.contains(digest):
+        resp = app.response_class(status=304)
+    else:
+        resp = make_response(data)
+        resp.headers['Content-Type'] = 'application/octet-stream'
+    resp.set_etag(digest)
+    resp.headers['Cache-Control'] = 'private, max-age=86400'
+    return resp
+
+_ART_HASH = re.compile(r'[0-9a-f]{32}')
+
+@app.route('/art/<digest>-<int:size>.webp')
+@require_auth
+def track_art(digest, size):
+    """Cover art thumbnail; the name is content-addressed, so it never changes."""
+    path = _art.path(digest, size) if _ART_HASH.fullmatch(digest) else None
+    if path is None:
+        return jsonify({'error': 'Not found'}), 404
+    resp = send_from_directory(os.path.abspath(os.path.dirname(path)), os.path.basename(path),
+                               mimetype='image/webp', conditional=True, etag=digest)
+    resp.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return resp
+
 @app.route('/play/<path:filename>')
 @require_auth
 def play(filename):
     """Stream audio file — redirect to Supabase signed URL on Vercel, serve locally otherwise."""
     if USE_SUPABASE:
         try:
-            url_map = _sb_signed_urls([filename])
-            signed = url_map.get(filename, '')
+            signed = _signed_urls.get(filename)
             if signed:
                 return redirect(signed, code=302)
         except Exception as e:
             app.logger.error(f'play() sign error: {e}')
         return jsonify({'error': 'Could not generate signed URL'}), 503
-    return send_from_directory(MUSIC_FOLDER, filename)
+    return _send_audio(filename)
+
+class _FileRange:
+    """File limited to `length` bytes from its current position.
+
+    Keeps fileno()/tell() so wsgi.file_wrapper implementations can still
+    sendfile() it; plain iteration stops at the end of the range.
+    """
+
+    def __init__(self, f, length):
+        self._f    = f
+        self._left = length
+
+    def read(self, size=-1):
+        if self._left <= 0:
+            return b''
+        data = self._f.read(self._left if size < 0 else min(size, self._left))
+        self._left -= len(data)
+        return data
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def tell(self):
+        return self._f.tell()
+
+    def close(self):
+        self._f.close()
+
+def _send_audio(filename):
+    """Serve a local audio file with byte-range, If-Range and ETag support.
+
+    Werkzeug answers conditional and Range requests (206/304/416). Whole-file
+    responses already go through the server's wsgi.file_wrapper; for 206 we
+    hand it the file positioned at the range start too, so servers that
+    implement it with os.sendfile (gunicorn, uWSGI) stream seeks zero-copy.
+    """
+    resp = send_from_directory(MUSIC_FOLDER, filename, conditional=True, etag=True)
+    resp.headers.setdefault('Accept-Ranges', 'bytes')
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if resp.status_code == 206 and file_wrapper and resp.content_range:
+        rng = resp.content_range
+        f   = open(safe_join(MUSIC_FOLDER, filename), 'rb')
+        f.seek(rng.start)
+        resp.response.close()
+        resp.response = file_wrapper(_FileRange(f, rng.stop - rng.start), 64 * 1024)
+        resp.direct_passthrough = True
+    return resp
 
 @app.route('/video/<path:filename>')
 def serve_video(filename):
@@ -518,8 +1592,216 @@ def serve_video(filename):
 # ── iOS PWA Splash Screen Generator ───────────────────────────────
 # iOS requires a splash image whose pixel dimensions EXACTLY match the
 # device screen (logical-px × DPR). We generate each size on-demand
-# with Pillow and cache the PNG bytes in memory for subsequent hits.
-_splash_cache: dict = {}
+# with Pillow; the known iPhone sizes (the <link>s in index.html) are
+# pre-rendered in the background at startup. Rendered PNGs live in a
+# byte-budgeted in-memory LRU that spills evicted images to disk, so a
+# crawler walking arbitrary w×h pairs cannot grow the process unboundedly.
+SPLASH_SIZES = [(1320, 2868), (1206, 2622), (1290, 2796), (1179, 2556), (1170, 2532),
+                (1284, 2778), (1125, 2436), (750, 1334), (1242, 2208)]
+SPLASH_CACHE_BYTES = int(os.environ.get('SPLASH_CACHE_BYTES', str(8 * 1024 * 1024)))
+SPLASH_DISK_MAX    = int(os.environ.get('SPLASH_DISK_MAX', '64'))
+SPLASH_DIR         = os.environ.get('SPLASH_DIR') or (
+    '/tmp/leakify-splash' if IS_VERCEL
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'splash'))
+
+class _SplashCache:
+    """LRU of (w, h) → PNG bytes bounded by total size, with a disk spill tier."""
+
+    def __init__(self, max_bytes, disk_dir, disk_max):
+        self.max_bytes = max_bytes
+        self.disk_dir  = disk_dir
+        self.disk_max  = disk_max
+        self.bytes     = 0
+        self.hits = self.disk_hits = self.misses = self.spills = 0
+        self.render_seconds = 0.0
+        self._mem  = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, '%dx%d.png' % key)
+
+    def get(self, key):
+        with self._lock:
+            png = self._mem.get(key)
+            if png is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return png
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                png = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self.put(key, png, spill=False)
+        return png
+
+    def put(self, key, png, spill=True, render_seconds=0.0):
+        """Cache `png`; `render_seconds` is the time it took to render (0 for disk hits)."""
+        evicted = []
+        with self._lock:
+            self.render_seconds += render_seconds
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._mem[key] = png
+            self.bytes    += len(png)
+            while self.bytes > self.max_bytes and len(self._mem) > 1:
+                k, v = self._mem.popitem(last=False)
+                self.bytes -= len(v)
+                evicted.append((k, v))
+        if spill:
+            for k, v in evicted:
+                self._spill(k, v)
+
+    def _spill(self, key, png):
+        """Write an evicted image to disk, pruning the oldest spills past disk_max."""
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(png)
+            os.replace(tmp, path)
+            with self._lock:
+                self.spills += 1
+            files = sorted((e for e in os.scandir(self.disk_dir) if e.name.endswith('.png')),
+                           key=lambda e: e.stat().st_mtime)
+            for e in files[:max(0, len(files) - self.disk_max)]:
+                os.remove(e.path)
+        except OSError:
+            pass   # read-only filesystem: the image is simply re-rendered next time
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._mem), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'spills': self.spills, 'render_seconds': round(self.render_seconds, 3)}
+
+_splash_cache = _SplashCache(SPLASH_CACHE_BYTES, SPLASH_DIR, SPLASH_DISK_MAX)
+
+_FONT_CANDIDATES = {
+    True:  ['/System/Library/Fonts/Helvetica.ttc',
+            '/System/Library/Fonts/SFNSDisplay.ttf',
+            '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'],
+    False: ['/System/Library/Fonts/Helvetica.ttc',
+            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'],
+}
+
+@lru_cache(maxsize=32)
+def _splash_font(size, bold):
+    from PIL import ImageFont
+    for candidate in _FONT_CANDIDATES[bold]:
+        if os.path.exists(candidate):
+            try:
+                return ImageFont.truetype(candidate, size)
+            except Exception:
+                pass
+    return ImageFont.load_default()
+
+@lru_cache(maxsize=1)
+def _splash_icon():
+    from PIL import Image
+    icon_path = os.path.join(os.path.dirname(__file__), 'static', 'icon-512.png')
+    if not os.path.exists(icon_path):
+        return None
+    return Image.open(icon_path).convert('RGBA')
+
+@lru_cache(maxsize=32)
+def _splash_icon_sized(size):
+    from PIL import Image
+    icon = _splash_icon()
+    return icon.resize((size, size), Image.LANCZOS) if icon is not None else None
+
+def _render_splash(w, h):
+    """Draw the splash for a w×h screen and return it as PNG bytes."""
+    from PIL import Image, ImageDraw
+
+    img    = Image.new('RGB', (w, h), (3, 0, 5))   # #030005
+    cx, cy = w // 2, h // 2
+
+    # Layered purple glow at center. Only the largest ellipse's bounding box
+    # is ever touched, so composite that crop instead of the whole canvas.
+    outer = 380
+    box   = (max(cx - outer, 0), max(cy - int(outer * 1.35), 0),
+             min(cx + outer + 1, w), min(cy + int(outer * 1.35) + 1, h))
+    glow  = img.crop(box).convert('RGBA')
+    for radius, alpha in [(380, 22), (240, 16), (120, 10)]:
+        overlay = Image.new('RGBA', glow.size, (0, 0, 0, 0))
+        ImageDraw.Draw(overlay).ellipse(
+            [cx - radius - box[0], cy - int(radius * 1.35) - box[1],
+             cx + radius - box[0], cy + int(radius * 1.35) - box[1]],
+            fill=(191, 90, 242, alpha)
+        )
+        glow = Image.alpha_composite(glow, overlay)
+    img.paste(glow.convert('RGB'), box[:2])
+
+    draw = ImageDraw.Draw(img)
+
+    # Center app icon
+    icon = _splash_icon_sized(int(min(w, h) * 0.19))
+    if icon is not None:
+        img.paste(icon,
+                  (cx - icon.width // 2,
+                   cy - icon.height // 2 - int(h * 0.055)), icon)
+
+    # "LEAKIFY" wordmark
+    font_size = max(28, int(w * 0.063))
+    font      = _splash_font(font_size, True)
+    bbox = draw.textbbox((0, 0), 'LEAKIFY', font=font)
+    tw   = bbox[2] - bbox[0]
+    th   = bbox[3] - bbox[1]
+    ty   = cy + int(h * 0.068)
+    # Purple ghost → sharp white on top
+    draw.text((cx - tw // 2,     ty),     'LEAKIFY', fill=(191, 90, 242), font=font)
+    draw.text((cx - tw // 2 - 1, ty - 1), 'LEAKIFY', fill=(255, 255, 255), font=font)
+
+    # Subtitle "999 · Private Vault"
+    sub_font = _splash_font(max(12, int(font_size * 0.40)), False)
+    sub  = '999 \u00b7 Private Vault'
+    sb   = draw.textbbox((0, 0), sub, font=sub_font)
+    draw.text((cx - (sb[2] - sb[0]) // 2, ty + th + int(h * 0.016)),
+              sub, fill=(191, 90, 242), font=sub_font)
+
+    # The canvas is mostly one flat colour: plain zlib gets within a few percent
+    # of optimize=True at a fraction of the cost.
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=6)
+    return buf.getvalue()
+
+def _splash_png(w, h):
+    png = _splash_cache.get((w, h))
+    if png is None:
+        t0  = time.perf_counter()
+        png = _render_splash(w, h)
+        elapsed = time.perf_counter() - t0
+        _splash_render_seconds.observe(elapsed)
+        _splash_cache.put((w, h), png, render_seconds=elapsed)
+    return png
+
+def _prerender_splashes():
+    t0 = time.perf_counter()
+    try:
+        for w, h in SPLASH_SIZES:
+            _splash_png(w, h)
+    except Exception as e:
+        app.logger.error(f'Splash pre-render failed: {e}')
+        return
+    app.logger.info(f'Pre-rendered {len(SPLASH_SIZES)} splash screens in '
+                    f'{(time.perf_counter() - t0) * 1000:.0f} ms')
+
+def _splash_size(args):
+    """Clamped (w, h) from the query args, or None if they are not integers."""
+    try:
+        return (max(320, min(int(args.get('w', 1290)), 2732)),
+                max(480, min(int(args.get('h', 2796)), 5464)))
+    except (ValueError, TypeError):
+        return None
 
 @app.route('/splash')
 def splash_image():
@@ -528,103 +1810,159 @@ def splash_image():
     Query params: w=<physical-px-width>  h=<physical-px-height>
     Example: /splash?w=1290&h=2796  →  iPhone 15 Pro Max
     """
+    size = _splash_size(request.args)
+    if size is None:
+        return send_from_directory('static', 'icon-1024.png')
+
     try:
-        w = max(320, min(int(request.args.get('w', 1290)), 2732))
-        h = max(480, min(int(request.args.get('h', 2796)), 5464))
-    except (ValueError, TypeError):
+        png_bytes = _splash_png(*size)
+    except Exception:
+        # Pillow unavailable or rendering error → fall back to app icon
         return send_from_directory('static', 'icon-1024.png')
 
-    if (w, h) in _splash_cache:
-        resp = make_response(_splash_cache[(w, h)])
-        resp.headers['Content-Type']  = 'image/png'
-        resp.headers['Cache-Control'] = 'public, max-age=604800'
+    resp = make_response(png_bytes)
+    resp.headers['Content-Type']  = 'image/png'
+    resp.headers['Cache-Control'] = 'public, max-age=604800'
+    return resp
+
+# ── Instance startup ───────────────────────────────────────
+# Folders, placeholder icons, splash pre-rendering and the catalog refresher
+# belong to the serving process, so they run from a one-time hook instead of
+# at import: metadata/analysis pool workers re-import this file (as
+# __mp_main__ under `python app.py`) and must not repeat them. In cold-start
+# mode none of it runs: folders and icons are a build step
+# (`python app.py icons`) and nothing is pre-rendered.
+_instance_started = threading.Lock()   # acquired once, by the first caller only
+
+def _start_instance():
+    if COLD_START or not _instance_started.acquire(blocking=False):
+        return
+    create_folders()
+    generate_icons()
+    threading.Thread(target=_prerender_splashes, daemon=True, name='splash-prerender').start()
+    if CATALOG_REFRESH_INTERVAL > 0:
+        threading.Thread(target=_catalog_refresher, daemon=True, name='catalog-refresher').start()
+
+@app.before_request
+def _ensure_instance_started():
+    if not _instance_started.locked():
+        _start_instance()
+
+# ── Cold-start instrumentation ─────────────────────────────
+# Import time of this module and the wall time of the first request it
+# serves, logged once, sent as Server-Timing on that response and kept
+# in /api/debug, so cold starts on Vercel can be measured and watched.
+_startup = {
+    'cold_start_mode': COLD_START,
+    'import_ms':       round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1),
+    'first_request':   None,
+}
+_first_request_claim = threading.Lock()   # acquired once, by the first request only
+
+@app.before_request
+def _start_first_request_timer():
+    if _startup['first_request'] is None and _first_request_claim.acquire(blocking=False):
+        request.environ['leakify.first_request_t0'] = time.perf_counter()
+
+@app.after_request
+def _record_first_request(resp):
+    t0 = request.environ.get('leakify.first_request_t0')
+    if t0 is None:
         return resp
+    ms = round((time.perf_counter() - t0) * 1000, 1)
+    _startup['first_request'] = {
+        'path':            request.path,
+        'status':          resp.status_code,
+        'ms':              ms,
+        'since_import_ms': round((t0 - _IMPORT_STARTED) * 1000 - _startup['import_ms'], 1),
+    }
+    resp.headers['Server-Timing'] = f'import;dur={_startup["import_ms"]}, first-request;dur={ms}'
+    app.logger.info(f'Cold start: import {_startup["import_ms"]} ms, '
+                    f'first request {request.path} {ms} ms')
+    return resp
 
-    try:
-        from PIL import Image, ImageDraw, ImageFont
-
-        img     = Image.new('RGB', (w, h), (3, 0, 5))   # #030005
-        cx, cy  = w // 2, h // 2
-
-        # Layered purple glow at center
-        for radius, alpha in [(380, 22), (240, 16), (120, 10)]:
-            overlay = Image.new('RGBA', (w, h), (0, 0, 0, 0))
-            od = ImageDraw.Draw(overlay)
-            od.ellipse(
-                [cx - radius, cy - int(radius * 1.35),
-                 cx + radius, cy + int(radius * 1.35)],
-                fill=(191, 90, 242, alpha)
-            )
-            img = Image.alpha_composite(img.convert('RGBA'), overlay).convert('RGB')
-
-        draw = ImageDraw.Draw(img)
-
-        # Center app icon
-        icon_path = os.path.join(os.path.dirname(__file__), 'static', 'icon-512.png')
-        if os.path.exists(icon_path):
-            icon      = Image.open(icon_path).convert('RGBA')
-            icon_size = int(min(w, h) * 0.19)
-            icon      = icon.resize((icon_size, icon_size), Image.LANCZOS)
-            img.paste(icon,
-                      (cx - icon_size // 2,
-                       cy - icon_size // 2 - int(h * 0.055)), icon)
-
-        # "LEAKIFY" wordmark
-        font_size = max(28, int(w * 0.063))
-        font      = ImageFont.load_default()
-        for candidate in [
-            '/System/Library/Fonts/Helvetica.ttc',
-            '/System/Library/Fonts/SFNSDisplay.ttf',
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
-        ]:
-            if os.path.exists(candidate):
-                try:
-                    font = ImageFont.truetype(candidate, font_size)
-                    break
-                except Exception:
-                    pass
 
-        bbox = draw.textbbox((0, 0), 'LEAKIFY', font=font)
-        tw   = bbox[2] - bbox[0]
-        th   = bbox[3] - bbox[1]
-        ty   = cy + int(h * 0.068)
-        # Purple ghost → sharp white on top
-        draw.text((cx - tw // 2,     ty),     'LEAKIFY', fill=(191, 90, 242), font=font)
-        draw.text((cx - tw // 2 - 1, ty - 1), 'LEAKIFY', fill=(255, 255, 255), font=font)
-
-        # Subtitle "999 · Private Vault"
-        sub_size = max(12, int(font_size * 0.40))
-        sub_font = ImageFont.load_default()
-        for candidate in [
-            '/System/Library/Fonts/Helvetica.ttc',
-            '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
-        ]:
-            if os.path.exists(candidate):
-                try:
-                    sub_font = ImageFont.truetype(candidate, sub_size)
-                    break
-                except Exception:
-                    pass
+# ── /api/metrics ───────────────────────────────────────────
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
 
-        sub  = '999 \u00b7 Private Vault'
-        sb   = draw.textbbox((0, 0), sub, font=sub_font)
-        draw.text((cx - (sb[2] - sb[0]) // 2, ty + th + int(h * 0.016)),
-                  sub, fill=(191, 90, 242), font=sub_font)
+@app.before_request
+def _start_request_timer():
+    request.environ['leakify.t0'] = time.perf_counter()
 
-        buf = io.BytesIO()
-        img.save(buf, format='PNG', optimize=True)
-        png_bytes              = buf.getvalue()
-        _splash_cache[(w, h)]  = png_bytes
+@app.after_request
+def _observe_request(resp):
+    t0 = request.environ.get('leakify.t0')
+    if t0 is not None:
+        # Route templates, not raw paths, keep the label set bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        _request_seconds.observe(time.perf_counter() - t0, route, request.method, str(resp.status_code))
+    return resp
 
-        resp = make_response(png_bytes)
-        resp.headers['Content-Type']  = 'image/png'
-        resp.headers['Cache-Control'] = 'public, max-age=604800'
-        return resp
+def _cache_stats():
+    splash = _splash_cache.stats()
+    return {
+        'catalog':     _catalog.stats(),
+        'signed_urls': _signed_urls.stats(),
+        'splash':      {'hits': splash['hits'] + splash['disk_hits'], 'misses': splash['misses']},
+    }
 
-    except Exception:
-        # Pillow unavailable or rendering error → fall back to app icon
-        return send_from_directory('static', 'icon-1024.png')
+def _cache_ratios():
+    ratios = {}
+    for name, st in _cache_stats().items():
+        total = st['hits'] + st['misses']
+        ratios[(name,)] = st['hits'] / total if total else 0.0
+    return ratios
+
+_metrics.gauge('leakify_cache_hits_total', 'Cache hits, by cache.', ('cache',),
+               lambda: {(k,): v['hits'] for k, v in _cache_stats().items()}, kind='counter')
+_metrics.gauge('leakify_cache_misses_total', 'Cache misses, by cache.', ('cache',),
+               lambda: {(k,): v['misses'] for k, v in _cache_stats().items()}, kind='counter')
+_metrics.gauge('leakify_cache_hit_ratio', 'Hits / (hits + misses) since start, by cache.', ('cache',),
+               _cache_ratios)
+_metrics.gauge('leakify_http_pool_connections_total', 'Supabase connections opened vs. reused.', ('state',),
+               lambda: {(k,): v for k, v in _http.stats().items() if k in ('opened', 'reused')},
+               kind='counter')
+_metrics.gauge('leakify_catalog_tracks', 'Tracks in the cached catalog.', (),
+               lambda: {(): len(_catalog.songs or ())})
+
+def _operator_authorized():
+    """A logged-in session, or `Authorization: Bearer $METRICS_TOKEN` for scrapers."""
+    bearer = request.headers.get('Authorization', '')
+    return bool(session.get('authed')) or bool(
+        METRICS_TOKEN and hmac.compare_digest(bearer, f'Bearer {METRICS_TOKEN}'))
+
+@app.route('/api/metrics')
+def metrics():
+    """Prometheus text metrics, for a logged-in session or `Authorization: Bearer $METRICS_TOKEN`."""
+    if not _operator_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    resp = make_response(_metrics.render())
+    resp.headers['Content-Type']  = 'text/plain; version=0.0.4; charset=utf-8'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    if sys.argv[1:2] == ['icons']:
+        # Build-time: folders and placeholder icons, which cold-start mode never creates
+        create_folders()
+        generate_icons()
+    elif sys.argv[1:2] == ['snapshot']:
+        # Build-time: write the read-only catalog snapshot shipped with the deployment
+        _catalog_store.path = sys.argv[2] if len(sys.argv) > 2 else CATALOG_SNAPSHOT
+        songs = _build_catalog()
+        print(f'Wrote {len(songs)} tracks to {_catalog_store.path} '
+              f'(version {_save_snapshot(songs, _next_version(0))})')
+    elif sys.argv[1:2] == ['analyze']:
+        # Build-time: metadata, peaks, loudness and cover art for the local
+        # library, shipped as METADATA_DB, ANALYSIS_DIR and ART_DIR
+        _library.scan()
+        n = _metadata.update(_library.signatures())
+        print(f'Read metadata for {n} tracks into {METADATA_DB}')
+        n = _analysis.update(_library.signatures())
+        print(f'Analysed {n} tracks into {ANALYSIS_DIR}')
+        n = _art.update(_library.signatures())
+        print(f'Extracted art for {n} tracks into {ART_DIR}')
+    else:
+        _start_instance()
+        app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,501 @@
+"""Optional async (ASGI) serving mode.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000      # or: python asgi.py
+
+The Flask app stays the single source of truth for routing, auth, headers
+and response formats. This layer puts an event loop in front of it:
+
+  * Supabase I/O for /api/songs, /api/song-url, /api/sign and /play runs on an asyncio
+    HTTP client, so a bucket walk lists folders concurrently and a slow
+    Storage response parks a coroutine instead of a worker thread;
+  * CPU work (dedup, /splash rendering) runs on a small CPU pool;
+  * the request is then answered by the Flask view on a bridge thread,
+    where the catalog / signed-URL / splash caches are already warm.
+
+Login and every other route go straight through the bridge. One process
+can hold hundreds of concurrent clients; only the bridge pool
+(ASGI_THREADS) bounds how many Flask views run at the same time.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from http.cookies import SimpleCookie
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import asyncio
+import io
+import json
+import os
+import ssl
+import sys
+import time
+
+import app as leakify
+
+ASGI_THREADS          = int(os.environ.get('ASGI_THREADS', '32'))
+ASGI_CPU_WORKERS      = int(os.environ.get('ASGI_CPU_WORKERS', '0')) or (os.cpu_count() or 2)
+ASGI_LIST_CONCURRENCY = int(os.environ.get('ASGI_LIST_CONCURRENCY', '32'))
+
+_bridge = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi-wsgi')
+_cpu    = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix='asgi-cpu')
+
+def _run_in(pool, fn, *args):
+    return asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+# ── Async HTTP client ──────────────────────────────────────
+class _AsyncHttpPool:
+    """asyncio counterpart of app._HttpPool: keep-alive HTTP/1.1 connections per host."""
+
+    def __init__(self, size, connect_timeout):
+        self.size            = size
+        self.connect_timeout = connect_timeout
+        self.opened          = 0
+        self.reused          = 0
+        self._idle           = defaultdict(list)   # {(scheme, host, port): [(reader, writer), ...]}
+        self._loop           = None
+        self._ssl            = None
+
+    async def _open(self, key):
+        scheme, host, port = key
+        ctx = None
+        if scheme == 'https':
+            ctx = self._ssl = self._ssl or ssl.create_default_context()
+        self.opened += 1
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port or (443 if ctx else 80), ssl=ctx),
+            self.connect_timeout)
+
+    async def request(self, method, url, body=None, headers=None, timeout=30):
+        """Send one request and return the response body; HTTPError for 4xx/5xx."""
+        parts = urlsplit(url)
+        key   = (parts.scheme, parts.hostname, parts.port)
+        path  = parts.path + (f'?{parts.query}' if parts.query else '')
+        host  = parts.netloc.rpartition('@')[2]
+        loop  = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connections belong to the loop that opened them
+            self._loop, self._idle = loop, defaultdict(list)
+        while True:
+            reused = bool(self._idle[key])
+            if reused:
+                self.reused += 1
+                conn = self._idle[key].pop()
+            else:
+                conn = await self._open(key)
+            try:
+                status, reason, hdrs, data, keep = await asyncio.wait_for(
+                    self._roundtrip(conn, method, host, path, body or b'', headers or {}), timeout)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                conn[1].close()
+                if reused:
+                    continue   # the server closed an idle connection; retry on a fresh one
+                raise
+            except BaseException:
+                conn[1].close()
+                raise
+            if keep and len(self._idle[key]) < self.size:
+                self._idle[key].append(conn)
+            else:
+                conn[1].close()
+            if status >= 400:
+                raise HTTPError(url, status, reason, hdrs, io.BytesIO(data))
+            return data
+
+    @staticmethod
+    async def _roundtrip(conn, method, host, path, body, headers):
+        reader, writer = conn
+        head = [f'{method} {path} HTTP/1.1', f'Host: {host}', f'Content-Length: {len(body)}']
+        head += [f'{k}: {v}' for k, v in headers.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status = 100
+        while 100 <= status < 200:   # skip interim responses (100 Continue, 103 Early Hints)
+            status_line = (await reader.readuntil(b'\r\n')).decode('latin-1').split(' ', 2)
+            status      = int(status_line[1])
+            reason      = status_line[2].strip() if len(status_line) > 2 else ''
+            hdrs        = Message()
+            while True:
+                line = await reader.readuntil(b'\r\n')
+                if line == b'\r\n':
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                hdrs[name.strip()] = value.strip()
+
+        keep = (hdrs.get('Connection') or '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304):
+            data = b''   # never has a body, whatever the headers say
+        elif 'chunked' in (hdrs.get('Transfer-Encoding') or '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass   # trailers
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif hdrs.get('Content-Length') is not None:
+            data = await reader.readexactly(int(hdrs['Content-Length']))
+        else:
+            # Delimited by EOF: the connection cannot be reused
+            data, keep = await reader.read(), False
+        return status, reason, hdrs, data, keep
+
+_http = _AsyncHttpPool(leakify.HTTP_POOL_SIZE, leakify.HTTP_CONNECT_TIMEOUT)
+
+
+# ── Supabase, async ────────────────────────────────────────
+async def _sb_post(call, endpoint, payload, timeout):
+    """POST to a Storage endpoint, recorded under the same metrics as the sync client."""
+    url = f'{leakify.SUPABASE_URL}/storage/v1/{endpoint}/{leakify.SUPABASE_BUCKET}'
+    t0  = time.perf_counter()
+    try:
+        data = await _http.request('POST', url, json.dumps(payload).encode(),
+                                   leakify._sb_headers(), timeout)
+        return json.loads(data)
+    except Exception:
+        leakify._supabase_errors.inc(call)
+        raise
+    finally:
+        leakify._supabase_seconds.observe(time.perf_counter() - t0, call)
+
+async def _sb_list_all(prefix):
+    """Every entry of one folder, page by page (pages of a folder are sequential)."""
+    items, offset, requests = [], 0, 0
+    while True:
+        page = await _sb_post('list', 'object/list', {
+            'prefix': prefix, 'limit': leakify.SUPABASE_LIST_PAGE, 'offset': offset,
+            'sortBy': {'column': 'name', 'order': 'asc'},
+        }, timeout=15)
+        requests += 1
+        items.extend(page)
+        if len(page) < leakify.SUPABASE_LIST_PAGE:
+            return items, requests
+        offset += len(page)
+
+async def _sb_walk(prefix=''):
+    """Every audio path under `prefix`; all known folders are listed concurrently."""
+    stats = {'requests': 0, 'folders': 0, 'paths': 0, 'mode': 'async'}
+    t0    = time.perf_counter()
+    limit = asyncio.Semaphore(ASGI_LIST_CONCURRENCY)
+    paths = []
+
+    async def visit(folder):
+        async with limit:
+            items, requests = await _sb_list_all(folder)
+        stats['folders']  += 1
+        stats['requests'] += requests
+        subfolders = []
+        for item in items:
+            name = item.get('name', '')
+            if name == '.emptyFolderPlaceholder':
+                continue
+            full = f"{folder}/{name}" if folder else name
+            if item.get('id') is None:
+                subfolders.append(full)
+            elif os.path.splitext(name)[1].lower() in leakify.AUDIO_EXTS:
+                paths.append(full)
+        await asyncio.gather(*(visit(f) for f in subfolders))
+
+    await visit(prefix)
+    stats['paths']        = len(paths)
+    stats['wall_seconds'] = round(time.perf_counter() - t0, 4)
+    leakify._sb_last_walk.clear()
+    leakify._sb_last_walk.update(stats)
+    return paths
+
+async def _sb_sign_chunk(paths):
+    """One object/sign request, retried like app._sb_sign_chunk_retrying."""
+    for attempt in range(leakify.SIGN_RETRIES + 1):
+        try:
+            items = await _sb_post('sign', 'object/sign', {
+                'paths': paths, 'expiresIn': leakify.SUPABASE_SIGNED_URL_TTL}, timeout=20)
+            return leakify._signed_url_map(items)
+        except Exception as e:
+            if attempt == leakify.SIGN_RETRIES or not leakify._sign_retryable(e):
+                raise
+            await asyncio.sleep(leakify._sign_backoff(attempt + 1))
+
+async def _sb_signed_urls(paths):
+    """Chunks signed SIGN_WORKERS at a time; same partial-failure rules as app._sb_signed_urls."""
+    limit  = asyncio.Semaphore(max(leakify.SIGN_WORKERS, 1))
+    chunks = leakify._chunks(paths, leakify.SIGN_CHUNK_SIZE)
+
+    async def sign(chunk):
+        async with limit:
+            return await _sb_sign_chunk(chunk)
+
+    outcomes = await asyncio.gather(*(sign(c) for c in chunks), return_exceptions=True)
+    result, failed = {}, [o for o in outcomes if isinstance(o, Exception)]
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, Exception):
+            leakify.app.logger.error(f'Supabase sign failed for {len(chunk)} paths: {outcome}')
+        else:
+            result.update(outcome)
+    if failed and len(failed) == len(chunks):
+        raise failed[-1]
+    return result
+
+async def _sign_many(paths, refresh=False):
+    """Async twin of _SignedUrlCache.get_many: only cache misses hit Supabase."""
+    cache = leakify._signed_urls
+    paths = list(dict.fromkeys(paths))
+    found, missing = ({}, paths) if refresh else cache._lookup(paths, time.time())
+    if missing:
+        signed_at = time.time()
+        url_map   = await _sb_signed_urls(missing)
+        cache._store(url_map, signed_at + leakify.SUPABASE_SIGNED_URL_TTL)
+        found.update(url_map)
+    return found
+
+
+# ── Catalog, async ─────────────────────────────────────────
+_rebuild_task = None
+
+def _dedup_paths(paths):
+    songs = leakify._dedup_tracks(
+        (leakify._raw_track(p, leakify.SUPABASE_BUCKET) for p in paths), lambda _path: "")
+    leakify._attach_analysis(songs)
+    return songs
+
+async def _build_and_commit():
+    """Same steps and failure handling as _build_catalog()'s Supabase branch and _rebuild()."""
+    t0 = time.perf_counter()
+    try:
+        with leakify._catalog_phase_seconds.time('walk_dedup'):
+            songs = await _run_in(_cpu, _dedup_paths, await _sb_walk(''))
+    except Exception as e:
+        await _run_in(_bridge, leakify._catalog.keep_previous, f'Supabase listing failed: {e}')
+        return
+    if leakify.LAZY_SIGNING:
+        await _run_in(_bridge, leakify._catalog.commit, songs, t0)
+        return
+    try:
+        with leakify._catalog_phase_seconds.time('sign'):
+            url_map = await _sign_many([s["filename"] for s in songs])
+    except Exception as sign_err:
+        leakify.app.logger.error(f'Supabase batch sign failed: {sign_err}')
+        url_map = None
+    leakify._attach_urls(songs, url_map)
+    await _run_in(_bridge, leakify._catalog.commit, songs, t0)
+
+async def _rebuild():
+    """Single-flight rebuild: concurrent callers await the same task."""
+    global _rebuild_task
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.ensure_future(_build_and_commit())
+    await asyncio.shield(_rebuild_task)
+
+def _refresh_in_background(loop):
+    catalog = leakify._catalog
+    catalog._refreshing = True
+
+    async def run():
+        try:
+            await _rebuild()
+        except Exception as e:
+            leakify.app.logger.error(f'Background catalog refresh failed: {e}')
+        finally:
+            catalog._refreshing = False
+
+    loop.call_soon_threadsafe(lambda: asyncio.ensure_future(run()))
+
+async def _catalog_ready():
+    """Make the Flask view's _catalog.get() a cache hit (or a stale-while-refreshing hit)."""
+    catalog = leakify._catalog
+    if not leakify.USE_SUPABASE:
+        await _run_in(_bridge, catalog.get)   # local scan: disk I/O, no Supabase
+        return
+    loop    = asyncio.get_running_loop()
+    refresh = lambda: _refresh_in_background(loop)
+
+    def servable():
+        # catalog._lock is held for a whole install (encode, compress, index):
+        # never wait for it on the event loop
+        with catalog._lock:
+            if catalog.payload is None and not catalog._snapshot_tried:
+                catalog._load_snapshot(refresh=refresh)
+            return catalog._servable(time.time(), refresh)
+
+    if not await _run_in(_bridge, servable):
+        await _rebuild()
+
+
+# ── Session check (same signed cookie as Flask) ────────────
+def _authed(headers):
+    jar = SimpleCookie()
+    for name, value in headers:
+        if name == b'cookie':
+            jar.load(value.decode('latin-1'))
+    morsel = jar.get(leakify.app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return False
+    serializer = leakify.app.session_interface.get_signing_serializer(leakify.app)
+    try:
+        data = serializer.loads(morsel.value,
+                                max_age=int(leakify.app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return False
+    return bool(data.get('authed'))
+
+
+async def _prewarm(scope, body):
+    """Do a route's slow I/O and CPU work here; returns the scope to hand to Flask."""
+    path = scope['path']
+    if scope['method'] == 'POST' and path == '/api/sign' and leakify.USE_SUPABASE:
+        try:
+            paths = json.loads(body).get('paths')
+        except (ValueError, AttributeError):
+            return scope   # Flask answers 400
+        if (isinstance(paths, list) and len(paths) <= leakify.SIGN_REQUEST_MAX
+                and all(isinstance(p, str) and p for p in paths) and _authed(scope['headers'])):
+            await _sign_many(paths)
+        return scope
+    if scope['method'] != 'GET':
+        return scope
+    query = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+    if path == '/splash':
+        size = leakify._splash_size(query)
+        if size:
+            await _run_in(_cpu, leakify._splash_png, *size)
+        return scope
+    if not _authed(scope['headers']):
+        return scope   # Flask answers 401
+    if path == '/api/songs':
+        await _catalog_ready()
+    elif path == '/api/song-url' and leakify.USE_SUPABASE and query.get('path'):
+        if query.get('refresh') == '1':
+            await _sign_many([query['path']], refresh=True)
+            # Already re-signed: let the view read it from the cache
+            query.pop('refresh')
+            scope = {**scope, 'query_string': urlencode(query).encode('latin-1')}
+        else:
+            await _sign_many([query['path']])
+    elif path.startswith('/play/') and leakify.USE_SUPABASE:
+        await _sign_many([path[len('/play/'):]])
+    return scope
+
+
+# ── WSGI bridge ────────────────────────────────────────────
+_BATCH = 1 << 16
+
+def _environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD':    scope['method'],
+        'SCRIPT_NAME':       scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO':         scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING':      scope['query_string'].decode('latin-1'),
+        'SERVER_NAME':       server[0],
+        'SERVER_PORT':       str(server[1]),
+        'SERVER_PROTOCOL':   f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR':       client[0],
+        'REMOTE_PORT':       str(client[1]),
+        'wsgi.version':      (1, 0),
+        'wsgi.url_scheme':   scope.get('scheme', 'http'),
+        'CONTENT_LENGTH':    str(len(body)),   # the body is already buffered
+        'wsgi.input':        io.BytesIO(body),
+        'wsgi.errors':       sys.stderr,
+        'wsgi.multithread':  True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once':     False,
+    }
+    for name, value in scope['headers']:
+        name  = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        if name != 'CONTENT_TYPE':
+            name = f'HTTP_{name}'
+        if name in environ:
+            # Repeated headers are comma-joined, except cookies (RFC 6265)
+            value = environ[name] + ('; ' if name == 'HTTP_COOKIE' else ',') + value
+        environ[name] = value
+    return environ
+
+def _start_wsgi(environ):
+    """Run the Flask app up to its first body chunk; returns (status, headers, iterator)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, headers
+        return lambda data: started.setdefault('early', []).append(data)
+
+    result = leakify.app(environ, start_response)
+    return started, result, iter(result)
+
+def _next_batch(it):
+    """Up to _BATCH bytes from a WSGI iterator (b'' at the end), read on a bridge thread."""
+    parts, size = [], 0
+    for chunk in it:
+        if chunk:
+            parts.append(chunk)
+            size += len(chunk)
+            if size >= _BATCH:
+                break
+    return b''.join(parts)
+
+async def _call_wsgi(scope, body, send):
+    started, result, it = await _run_in(_bridge, _start_wsgi, _environ(scope, body))
+    try:
+        first = await _run_in(_bridge, _next_batch, it)
+        status = int(started['status'].split(' ', 1)[0])
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                for k, v in started['headers']]})
+        chunk = b''.join(started.get('early', [])) + first
+        while chunk:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await _run_in(_bridge, _next_batch, it)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await _run_in(_bridge, result.close)
+
+
+# ── ASGI entry point ───────────────────────────────────────
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await _run_in(_bridge, leakify._start_instance)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body, more = [], True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body.append(message.get('body', b''))
+        more = message.get('more_body', False)
+
+    body = b''.join(body)
+    try:
+        scope = await _prewarm(scope, body)
+    except Exception as e:
+        # The Flask view retries synchronously and reports the error in its usual shape
+        leakify.app.logger.error(f'async prewarm of {scope["path"]} failed: {e}')
+    await _call_wsgi(scope, body, send)
+
+
+leakify._metrics.gauge(
+    'leakify_async_http_connections_total', 'Async Supabase connections opened vs. reused.',
+    ('state',), lambda: {('opened',): _http.opened, ('reused',): _http.reused}, kind='counter')
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('The async mode needs an ASGI server: pip install uvicorn')
+    uvicorn.run('asgi:app', host='0.0.0.0', port=int(os.environ.get('PORT', '5000')))
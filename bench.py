@@ -0,0 +1,265 @@
+"""Benchmarks for the catalog build, dedup, signing and splash rendering.
+
+    python bench.py                          # 1k, 10k and 100k tracks → bench_results.json
+    python bench.py --sizes 1k,10k --out new.json --compare bench_results.json
+
+Synthetic libraries (artist folders with Remasters / LEAKED / Session Edits /
+Extras subfolders and cross-folder duplicates) are generated under
+.cache/bench, once on disk for local mode and once behind a fake Storage
+API for Supabase mode. Every case runs in a fresh `python bench.py --child`
+process so import time, cold caches and peak RSS are measured honestly;
+the fake Storage API (fake_supabase.py) runs in this otherwise idle parent.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+
+ROOT       = os.path.dirname(os.path.abspath(__file__))
+ARTISTS    = ["JuiceWrld", "Destroy Lonely", "EsdeeKid", "Ken Carson", "D4vd"]
+SUBFOLDERS = ["Remasters", "LEAKED", "Session Edits", "Extras", ""]
+DUPLICATE_SHARE = 0.3   # fraction of tracks that reappear in a second subfolder
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    return int(float(text[:-1]) * 1000) if text.endswith('k') else int(text)
+
+
+def synthetic_paths(n, seed=999):
+    """`n` library-relative .mp3 paths; ~DUPLICATE_SHARE of titles appear twice."""
+    rng    = random.Random(seed)
+    titles = max(1, int(n * (1 - DUPLICATE_SHARE)))
+    paths, seen = [], set()
+    i = 0
+    while len(paths) < n:
+        t      = i % titles
+        artist = ARTISTS[t % len(ARTISTS)]
+        sub    = rng.choice(SUBFOLDERS)
+        # Deeper folders (eras/albums) under every subfolder, like the real bucket
+        era    = f"Era {t % 7}"
+        folder = "/".join(p for p in (artist, sub, era) if p)
+        path   = f"{folder}/Track {t:06d}.mp3"
+        i += 1
+        if path not in seen:
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def ensure_library(workdir, n):
+    """Create the on-disk library for `n` tracks (empty files) once; returns its root."""
+    root   = os.path.join(workdir, f'lib-{n}')
+    marker = os.path.join(root, '.complete')
+    if not os.path.exists(marker):
+        music = os.path.join(root, 'Leakify-music-src')
+        for rel in synthetic_paths(n):
+            path = os.path.join(music, *rel.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+        open(marker, 'w').close()
+    return root
+
+
+# ── Child process: one case ────────────────────────────────
+def _peak_rss_mb():
+    # VmHWM belongs to this exec'd image; ru_maxrss can inherit the parent's peak from fork
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _phase_seconds(app):
+    """Catalog phase totals, read back from the app's own /api/metrics registry."""
+    phases = {}
+    for m in re.finditer(r'^leakify_catalog_phase_duration_seconds_sum\{phase="(\w+)"\} (\S+)$',
+                         app._metrics.render(), re.M):
+        phases[m.group(1)] = round(float(m.group(2)), 4)
+    return phases
+
+
+def _timed(fn, repeat=1):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run_child(spec):
+    t0 = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import app
+    result = {'import_seconds': round(time.perf_counter() - t0, 4)}
+    # Metadata indexing is a background job with its own cost; keep it out of build timings
+    app._index_metadata_async = lambda files: None
+
+    if spec['case'] == 'splash':
+        for w, h in app.SPLASH_SIZES:
+            cold   = _timed(lambda: app._render_splash(w, h))
+            steady = _timed(lambda: app._render_splash(w, h), repeat=3)
+            result[f'{w}x{h}'] = {'cold_seconds': round(cold, 4), 'seconds': round(steady, 4),
+                                  'bytes': len(app._render_splash(w, h))}
+        result['peak_rss_mb'] = _peak_rss_mb()
+        return result
+
+    n = spec['size']
+    if spec['case'] == 'restart':
+        # A new process with last run's catalog.db: time to the first servable catalog
+        result['first_get_seconds'] = round(_timed(app._catalog.get), 4)
+        result['snapshot_loads']    = app._catalog.stats()['snapshot_loads']
+        result['peak_rss_mb']       = _peak_rss_mb()
+        return result
+
+    cold  = _timed(app._catalog.get)
+    songs = app._catalog.songs
+    result['cold_build_seconds'] = round(cold, 4)
+    result['cold_phases']        = _phase_seconds(app)
+
+    def rebuild():
+        app._catalog.invalidate()
+        app._catalog.get()
+    result['warm_build_seconds'] = round(_timed(rebuild, repeat=3), 4)
+    result['cached_get_seconds'] = round(_timed(app._catalog.get, repeat=20), 6)
+
+    client = app.app.test_client()
+    with client.session_transaction() as s:
+        s['authed'] = True
+    client.get('/api/songs', headers={'Accept-Encoding': 'gzip'})   # first encode is memoised
+    result['songs_request_seconds'] = round(_timed(
+        lambda: client.get('/api/songs', headers={'Accept-Encoding': 'gzip'}), repeat=5), 5)
+
+    raw   = [app._raw_track(p, app.SUPABASE_BUCKET) for p in synthetic_paths(n)]
+    dedup = _timed(lambda: app._dedup_tracks(raw, lambda _p: ''), repeat=3)
+    result['dedup_seconds']         = round(dedup, 4)
+    result['dedup_tracks_per_sec']  = int(len(raw) / dedup)
+
+    if spec['mode'] == 'supabase':
+        paths = [s['filename'] for s in songs][:5000]
+        sign  = _timed(lambda: app._sb_signed_urls(paths))
+        result['sign_seconds']        = round(sign, 4)
+        result['sign_paths_per_sec']  = int(len(paths) / sign)
+
+    result['tracks']               = len(songs)
+    result['build_tracks_per_sec'] = int(n / cold)
+    result['peak_rss_mb']          = _peak_rss_mb()
+    return result
+
+
+# ── Parent: orchestration ──────────────────────────────────
+def _run_case(spec, env, cwd):
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', json.dumps(spec)],
+                          env=env, cwd=cwd, capture_output=True, text=True)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith('{')]
+    if proc.returncode or not lines:
+        raise RuntimeError(f'{spec} failed:\n{proc.stderr[-2000:]}')
+    return json.loads(lines[-1])
+
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f'{prefix}.{k}' if prefix else k, v, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    return out
+
+
+def compare(old, new):
+    """Print every numeric metric present in both runs with its relative change."""
+    key  = lambda r: (r['case'], r.get('mode'), r.get('size'))
+    prev = {key(r): _flatten('', r['metrics'], {}) for r in old['results']}
+    for r in new['results']:
+        base = prev.get(key(r))
+        if not base:
+            continue
+        print(f"\n{r['case']} {r.get('mode') or ''} {r.get('size') or ''}".rstrip())
+        for name, value in _flatten('', r['metrics'], {}).items():
+            if base.get(name):
+                print(f'  {name:40s} {base[name]:>12} → {value:>12}  ({value / base[name] - 1:+.1%})')
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--sizes', default='1k,10k,100k')
+    ap.add_argument('--modes', default='local,supabase')
+    ap.add_argument('--workdir', default=os.path.join(ROOT, '.cache', 'bench'))
+    ap.add_argument('--out', default='bench_results.json')
+    ap.add_argument('--compare', metavar='PREVIOUS_JSON')
+    ap.add_argument('--no-splash', action='store_true')
+    ap.add_argument('--child', help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    base_env = {**os.environ, 'COLD_START': '1', 'METADATA_WORKERS': '1', 'PYTHONHASHSEED': '0',
+                'SUPABASE_URL': '', 'SUPABASE_SERVICE_KEY': '',
+                'CATALOG_SNAPSHOT': os.path.join(args.workdir, 'no-snapshot.db')}
+    from fake_supabase import FakeSupabase
+    storage = FakeSupabase().start()
+
+    run = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+           'platform': platform.platform(), 'results': []}
+    try:
+        run['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       capture_output=True, text=True).stdout.strip()
+    except OSError:
+        pass
+
+    def record(spec, env, cwd):
+        t0 = time.perf_counter()
+        metrics = _run_case(spec, env, cwd)
+        print(f"{spec['case']:8s} {spec.get('mode', ''):9s} {spec.get('size', ''):>7} "
+              f"done in {time.perf_counter() - t0:.1f}s: "
+              + ', '.join(f'{k}={v}' for k, v in metrics.items() if not isinstance(v, dict)))
+        run['results'].append({**spec, 'metrics': metrics})
+
+    for n in map(parse_size, args.sizes.split(',')):
+        for mode in args.modes.split(','):
+            db  = os.path.join(args.workdir, f'catalog-{mode}-{n}.db')
+            env = {**base_env, 'CATALOG_DB': db}
+            if mode == 'local':
+                cwd = ensure_library(args.workdir, n)
+            else:
+                cwd = args.workdir
+                storage.add_bucket(f'bench-{n}', paths=synthetic_paths(n))
+                env.update(SUPABASE_URL=storage.url, SUPABASE_SERVICE_KEY='bench',
+                           SUPABASE_BUCKET=f'bench-{n}')
+            if os.path.exists(db):
+                os.remove(db)
+            before = dict(storage.requests)
+            record({'case': 'catalog', 'mode': mode, 'size': n}, env, cwd)
+            if mode == 'supabase':
+                run['results'][-1]['metrics']['storage_requests'] = {
+                    k: v - before.get(k, 0) for k, v in storage.requests.items()}
+            record({'case': 'restart', 'mode': mode, 'size': n}, env, cwd)
+
+    if not args.no_splash:
+        record({'case': 'splash'}, base_env, args.workdir)
+
+    with open(args.out, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f'\nWrote {args.out}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), run)
+
+
+if __name__ == '__main__':
+    main()
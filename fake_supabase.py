@@ -0,0 +1,300 @@
+"""Local stand-in for the Supabase Storage REST API, for offline and load testing.
+
+    python fake_supabase.py --root Leakify-music-src --bucket JuiceWrld --port 54321
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_KEY=fake python app.py
+
+Implements just what app.py calls, with the same request and response shapes:
+
+  POST /storage/v1/object/list/<bucket>          folder listing (prefix/limit/offset/sortBy/search)
+  POST /storage/v1/object/sign/<bucket>          batch signing {"paths", "expiresIn"}
+  POST /storage/v1/object/sign/<bucket>/<path>   single signing {"expiresIn"}
+  GET  /storage/v1/object/sign/<bucket>/<path>?token=…   signed download, with Range
+
+Buckets are backed by a directory or by a list of synthetic paths (empty
+objects). Latency, jitter, error injection and a per-call page cap can be
+set on the command line, through FakeSupabase(...), or at runtime with
+POST /__fake/config; GET /__fake/stats returns per-route request counts.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+import argparse
+import hashlib
+import hmac
+import io
+import json
+import mimetypes
+import os
+import random
+import re
+import secrets
+import threading
+import time
+
+_ROUTE = re.compile(r'/storage/v1/object/(list|sign)/([^/]+)(?:/(.+))?')
+
+
+class FakeBucket:
+    """Folder tree of one bucket: {folder: [entry, ...]} sorted by name, plus file paths."""
+
+    def __init__(self, name, root=None, paths=()):
+        self.name    = name
+        self.root    = root
+        self.folders = {}
+        self.files   = {}   # {path: size}
+        if root:
+            for dirpath, _dirs, names in os.walk(root):
+                rel_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+                for n in names:
+                    rel = n if rel_dir == '.' else f'{rel_dir}/{n}'
+                    self._add(rel, os.path.getsize(os.path.join(dirpath, n)))
+        for p in paths:
+            self._add(p, 0)
+        self.folders = {k: [v[n] for n in sorted(v)] for k, v in self.folders.items()}
+
+    def _add(self, path, size):
+        parts = path.split('/')
+        self.files[path] = size
+        for depth, name in enumerate(parts):
+            parent = '/'.join(parts[:depth])
+            if depth == len(parts) - 1:
+                entry = {'name': name, 'id': hashlib.md5(path.encode()).hexdigest(),
+                         'updated_at': '2024-01-01T00:00:00.000Z',
+                         'metadata': {'size': size, 'mimetype': mimetypes.guess_type(name)[0]
+                                      or 'application/octet-stream'}}
+            else:
+                entry = {'name': name, 'id': None, 'updated_at': None, 'metadata': None}
+            self.folders.setdefault(parent, {})[name] = entry
+
+    def open(self, path):
+        """(file object, size) for a stored object; synthetic objects are empty."""
+        if self.root:
+            full = os.path.join(self.root, *path.split('/'))
+            return open(full, 'rb'), os.path.getsize(full)
+        return io.BytesIO(b''), 0
+
+
+class FakeSupabase(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, key='', latency=0.0, jitter=0.0,
+                 error_rate=0.0, page_max=None, seed=None):
+        super().__init__((host, port), _Handler)
+        self.buckets  = {}
+        self.key      = key          # '' accepts any bearer token
+        self.config   = {'latency': latency, 'jitter': jitter,
+                         'error_rate': error_rate, 'page_max': page_max}
+        self.requests = {}
+        self.errors   = 0
+        self.secret   = secrets.token_bytes(32)
+        self.rng      = random.Random(seed)
+        self.lock     = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def add_bucket(self, name, root=None, paths=()):
+        self.buckets[name] = FakeBucket(name, root, paths)
+        return self.buckets[name]
+
+    def start(self):
+        """Serve on a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, name='fake-supabase', daemon=True).start()
+        return self
+
+    def sign(self, bucket, path, expires_in):
+        exp   = int(time.time()) + int(expires_in)
+        token = f'{exp}.{self._mac(bucket, path, exp)}'
+        return f'/object/sign/{bucket}/{quote(path)}?token={token}'
+
+    def verify(self, bucket, path, token):
+        exp, _, mac = token.partition('.')
+        return (exp.isdigit() and int(exp) >= time.time()
+                and hmac.compare_digest(mac, self._mac(bucket, path, int(exp))))
+
+    def _mac(self, bucket, path, exp):
+        return hmac.new(self.secret, f'{bucket}/{path}:{exp}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def count(self, route):
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def delay_and_fail(self):
+        """Apply the configured latency; True if this request should fail."""
+        c = self.config
+        with self.lock:
+            wait = c['latency'] + (self.rng.uniform(0, c['jitter']) if c['jitter'] else 0.0)
+            fail = c['error_rate'] > 0 and self.rng.random() < c['error_rate']
+            self.errors += fail
+        if wait:
+            time.sleep(wait)
+        return fail
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize         = 1 << 16   # headers + JSON body in one segment
+
+    def log_message(self, *args):
+        pass
+
+    # ── plumbing ──
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, error, message):
+        self._json(status, {'statusCode': str(status), 'error': error, 'message': message})
+
+    def _authorized(self):
+        key = self.server.key
+        return not key or self.headers.get('Authorization', '') == f'Bearer {key}'
+
+    # ── routes ──
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+        if path == '/__fake/config':
+            self.server.config.update(json.loads(body or b'{}'))
+            return self._json(200, self.server.config)
+        m = _ROUTE.fullmatch(path)
+        if not m:
+            return self._error(404, 'not_found', 'Route not found')
+        action, bucket, obj = m.group(1), m.group(2), unquote(m.group(3) or '')
+        self.server.count(action)
+        if self.server.delay_and_fail():
+            return self._error(500, 'internal', 'Injected failure')
+        if not self._authorized():
+            return self._error(400, 'Unauthorized', 'Invalid JWT')
+        if bucket not in self.server.buckets:
+            return self._error(400, 'not_found', 'Bucket not found')
+        try:
+            req = json.loads(body or b'{}')
+        except ValueError:
+            return self._error(400, 'invalid_json', 'Body is not JSON')
+        b = self.server.buckets[bucket]
+
+        if action == 'list':
+            entries = b.folders.get(req.get('prefix', '').strip('/'), [])
+            if req.get('search'):
+                entries = [e for e in entries if req['search'].lower() in e['name'].lower()]
+            if (req.get('sortBy') or {}).get('order') == 'desc':
+                entries = entries[::-1]
+            limit = int(req.get('limit', 100))
+            if self.server.config['page_max']:
+                limit = min(limit, int(self.server.config['page_max']))
+            offset = int(req.get('offset', 0))
+            return self._json(200, entries[offset:offset + limit])
+
+        expires = req.get('expiresIn', 60)
+        if obj:
+            if obj not in b.files:
+                return self._error(400, 'not_found', 'Object not found')
+            return self._json(200, {'signedURL': self.server.sign(bucket, obj, expires)})
+        return self._json(200, [
+            {'path': p, 'error': None, 'signedURL': self.server.sign(bucket, p, expires)}
+            if p in b.files else {'path': p, 'error': 'Either the object does not exist or you do not have access to it', 'signedURL': None}
+            for p in req.get('paths', [])])
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        parts = urlsplit(self.path)
+        if parts.path == '/__fake/stats':
+            with self.server.lock:
+                return self._json(200, {'requests': self.server.requests, 'errors': self.server.errors,
+                                        'config': self.server.config})
+        m = _ROUTE.fullmatch(parts.path)
+        if not m or m.group(1) != 'sign' or not m.group(3):
+            return self._error(404, 'not_found', 'Route not found')
+        bucket, obj = m.group(2), unquote(m.group(3))
+        self.server.count('download')
+        if self.server.delay_and_fail():
+            return self._error(500, 'internal', 'Injected failure')
+        token = parse_qs(parts.query).get('token', [''])[0]
+        b     = self.server.buckets.get(bucket)
+        if b is None or obj not in b.files:
+            return self._error(400, 'not_found', 'Object not found')
+        if not self.server.verify(bucket, obj, token):
+            return self._error(400, 'InvalidJWT', 'Token is invalid or expired')
+        f, size = b.open(obj)
+        with f:
+            self._send_object(f, size, mimetypes.guess_type(obj)[0] or 'application/octet-stream', head)
+
+    def _send_object(self, f, size, mimetype, head):
+        start, end, status = 0, size - 1, 200
+        rng = self.headers.get('Range', '')
+        m   = re.fullmatch(r'bytes=(\d*)-(\d*)', rng.strip())
+        if rng and m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end   = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            else:
+                start = max(size - int(m.group(2)), 0)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        length = max(end - start + 1, 0)
+        self.send_response(status)
+        self.send_header('Content-Type', mimetype)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Cache-Control', 'max-age=3600')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if head or not length:
+            return
+        f.seek(start)
+        remaining = length
+        while remaining:
+            chunk = f.read(min(remaining, 1 << 16))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            remaining -= len(chunk)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    ap.add_argument('--root', help='directory served as the bucket (default: synthetic paths only)')
+    ap.add_argument('--bucket', default=os.environ.get('SUPABASE_BUCKET', 'JuiceWrld'))
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=54321)
+    ap.add_argument('--key', default='', help='required bearer token (default: accept any)')
+    ap.add_argument('--latency', type=float, default=0.0, help='added seconds per request')
+    ap.add_argument('--jitter', type=float, default=0.0, help='extra random seconds, 0..jitter')
+    ap.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that 500')
+    ap.add_argument('--page-max', type=int,
+                    help='cap on entries per list call (app pages only while SUPABASE_LIST_PAGE <= this)')
+    ap.add_argument('--synthetic', type=int, default=0, help='add N synthetic tracks (see bench.py)')
+    args = ap.parse_args(argv)
+
+    server = FakeSupabase(args.host, args.port, args.key, args.latency, args.jitter,
+                          args.error_rate, args.page_max)
+    paths = ()
+    if args.synthetic:
+        from bench import synthetic_paths
+        paths = synthetic_paths(args.synthetic)
+    bucket = server.add_bucket(args.bucket, args.root, paths)
+    print(f'Fake Supabase Storage on {server.url} — bucket {args.bucket!r}, {len(bucket.files)} objects')
+    print(f'  SUPABASE_URL={server.url} SUPABASE_SERVICE_KEY={args.key or "fake"} '
+          f'SUPABASE_BUCKET={args.bucket}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,625 @@
+"""Local library index and on-disk catalog snapshots.
+
+Shared by the web app (app.py) and the desktop player (main.py). A rescan
+stats each directory once and only lists directories whose mtime changed,
+so an untouched library costs one stat per folder instead of one per file.
+"""
+from collections import Counter, defaultdict, namedtuple
+import hashlib
+import heapq
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Paths are library-relative with '/' separators on every platform.
+ScanDiff = namedtuple('ScanDiff', ['added', 'removed', 'changed'])
+
+
+class LibraryIndex:
+    """Remembers directory mtimes and per-file (size, mtime) between scans."""
+
+    def __init__(self, root, exts=('.mp3',)):
+        self.root  = root
+        self.exts  = tuple(e.lower() for e in exts)
+        self.files = {}    # {rel_path: (size, mtime_ns)}
+        self._dirs = {}    # {rel_dir: (mtime_ns, [subdir rel paths], [file rel paths])}
+        self._lock = threading.Lock()
+
+    def _abs(self, rel):
+        return os.path.join(self.root, *rel.split('/')) if rel else self.root
+
+    def _list_dir(self, rel_dir):
+        """List one directory with os.scandir; returns (subdirs, {file: (size, mtime_ns)})."""
+        subdirs, files = [], {}
+        with os.scandir(self._abs(rel_dir)) as it:
+            for entry in it:
+                rel = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                try:
+                    if entry.is_dir():
+                        subdirs.append(rel)
+                    elif entry.name.lower().endswith(self.exts):
+                        st = entry.stat()
+                        files[rel] = (st.st_size, st.st_mtime_ns)
+                except OSError:
+                    continue
+        subdirs.sort()
+        return subdirs, files
+
+    def scan(self, full=False):
+        """Bring the index up to date and return a ScanDiff of what moved.
+
+        Directories whose mtime is unchanged are not listed again (their
+        subdirectories are still visited). Pass full=True to re-stat every
+        file, e.g. to catch in-place edits that do not touch the folder mtime.
+        """
+        with self._lock:
+            added, removed, changed = [], [], []
+            seen_dirs = set()
+            stack     = ['']
+            while stack:
+                rel_dir = stack.pop()
+                try:
+                    mtime = os.stat(self._abs(rel_dir)).st_mtime_ns
+                except OSError:
+                    continue
+                seen_dirs.add(rel_dir)
+                cached = self._dirs.get(rel_dir)
+                if cached and cached[0] == mtime and not full:
+                    stack.extend(reversed(cached[1]))
+                    continue
+
+                try:
+                    subdirs, files = self._list_dir(rel_dir)
+                except OSError:
+                    continue
+                old_files = set(cached[2]) if cached else set()
+                for rel, sig in files.items():
+                    prev = self.files.get(rel)
+                    if prev is None:
+                        added.append(rel)
+                    elif prev != sig:
+                        changed.append(rel)
+                    self.files[rel] = sig
+                for rel in old_files - files.keys():
+                    removed.append(rel)
+                    self.files.pop(rel, None)
+                self._dirs[rel_dir] = (mtime, subdirs, sorted(files))
+                stack.extend(reversed(subdirs))
+
+            # Folders that disappeared take their files with them
+            for rel_dir in [d for d in self._dirs if d not in seen_dirs]:
+                for rel in self._dirs.pop(rel_dir)[2]:
+                    if self.files.pop(rel, None) is not None:
+                        removed.append(rel)
+
+            return ScanDiff(sorted(added), sorted(removed), sorted(changed))
+
+    def paths(self):
+        """All indexed files, sorted."""
+        with self._lock:
+            return sorted(self.files)
+
+    def signatures(self):
+        """Copy of {rel_path: (size, mtime_ns)} for every indexed file."""
+        with self._lock:
+            return dict(self.files)
+
+
+# ── Catalog snapshot ───────────────────────────────────────
+# The deduplicated catalog is persisted to SQLite so a fresh process can
+# serve it immediately and rebuild in the background. A snapshot built at
+# deploy time can ship read-only next to the code (serverless filesystems);
+# the writable copy, when present, always wins.
+_TRACK_COLUMNS = ('filename', 'display', 'artist', 'subfolder', 'tag', 'priority', 'url', 'url_expires',
+                  'gain_db', 'art', 'meta')
+_DEFAULTS      = {'subfolder': '', 'tag': '', 'priority': 0, 'url': '', 'url_expires': 0.0,
+                  'gain_db': None, 'art': None, 'meta': None}
+
+# tracks is rewritten in full on every save, inside one transaction so
+# concurrent readers see either the previous or the new list. Columns added
+# since a snapshot file was created are added to it in place.
+_TRACK_SCHEMA = (
+    ('pos',         'INTEGER PRIMARY KEY'),
+    ('filename',    'TEXT NOT NULL'),
+    ('display',     'TEXT NOT NULL'),
+    ('artist',      'TEXT NOT NULL'),
+    ('subfolder',   "TEXT NOT NULL DEFAULT ''"),
+    ('tag',         "TEXT NOT NULL DEFAULT ''"),
+    ('priority',    'INTEGER NOT NULL DEFAULT 0'),
+    ('url',         "TEXT NOT NULL DEFAULT ''"),
+    ('url_expires', 'REAL NOT NULL DEFAULT 0'),
+    ('gain_db',     'REAL'),   # playback gain to the loudness target, if measured
+    ('art',         'TEXT'),   # cover art hash, if the track embeds a picture
+    ('meta',        'TEXT'),   # JSON audio metadata, if indexed
+)
+_SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tracks ({", ".join(f"{name} {decl}" for name, decl in _TRACK_SCHEMA)});
+'''
+
+
+def _content_hash(tracks):
+    # Hash the values as stored, so a loaded snapshot can be checked against it
+    h = hashlib.sha256()
+    for t in tracks:
+        h.update('\x1f'.join(str(t.get(c, _DEFAULTS.get(c, ''))) for c in _TRACK_COLUMNS[:6]).encode())
+        h.update(b'\x1e')
+    return h.hexdigest()
+
+
+class CatalogStore:
+    """SQLite snapshot of the catalog with a monotonically increasing version."""
+
+    def __init__(self, path, readonly_path=None):
+        self.path          = path
+        self.readonly_path = readonly_path
+
+    def _open_ro(self, path):
+        # Only the shipped snapshot never changes; the writable one may be
+        # mid-save in another worker, so it keeps SQLite's locking.
+        mode = 'ro&immutable=1' if path == self.readonly_path else 'ro'
+        uri  = pathlib.Path(path).absolute().as_uri() + f'?mode={mode}'
+        return sqlite3.connect(uri, uri=True)
+
+    def load(self):
+        """Return (tracks, meta) from the writable or shipped snapshot, or None.
+
+        A snapshot with no tracks, or whose tracks do not match its stored
+        hash, is treated as missing.
+        """
+        for path in (self.path, self.readonly_path):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                conn = self._open_ro(path)
+                try:
+                    conn.execute('BEGIN')   # meta and tracks from the same save
+                    meta = dict(conn.execute('SELECT key, value FROM meta'))
+                    # Snapshots written before a column existed lack it; it reads as its default
+                    have = {r[1] for r in conn.execute('PRAGMA table_info(tracks)')}
+                    rows = conn.execute(
+                        f'SELECT {", ".join(c if c in have else "NULL" for c in _TRACK_COLUMNS)} '
+                        'FROM tracks ORDER BY pos').fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                continue
+            meta['version'] = int(meta.get('version', 0))
+            meta['path']    = path
+            tracks = [{c: _DEFAULTS.get(c) if c not in have else v for c, v in zip(_TRACK_COLUMNS, r)}
+                      for r in rows]
+            digest = _content_hash(tracks)
+            if not tracks or meta.get('hash', digest) != digest:
+                continue
+            for t in tracks:
+                t['meta'] = json.loads(t['meta']) if t['meta'] else None
+            return tracks, meta
+        return None
+
+    def save(self, tracks, version=None, **meta):
+        """Persist `tracks` (dicts keyed like _TRACK_COLUMNS); returns the version.
+
+        Without an explicit `version` it only moves forward when the track
+        list itself changed. Returns None if the location is not writable
+        (read-only deployments).
+        """
+        digest = _content_hash(tracks)
+        # Continue from the shipped snapshot so versions never go backwards
+        shipped = self._shipped_meta()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10)
+        except (OSError, sqlite3.Error):
+            return None
+        try:
+            # Schema changes only ever add; they are committed on their own
+            conn.executescript(_SCHEMA)
+            have = {r[1] for r in conn.execute('PRAGMA table_info(tracks)')}
+            for name, decl in _TRACK_SCHEMA:
+                if name not in have:
+                    conn.execute(f'ALTER TABLE tracks ADD COLUMN {name} {decl}')
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                old = dict(conn.execute('SELECT key, value FROM meta')) or shipped
+                if version is None:
+                    version = int(old.get('version', 0))
+                    if old.get('hash') != digest:
+                        version += 1
+                conn.execute('DELETE FROM tracks')
+                conn.executemany(
+                    f'INSERT INTO tracks (pos, {", ".join(_TRACK_COLUMNS)}) '
+                    f'VALUES (?{", ?" * len(_TRACK_COLUMNS)})',
+                    [(i, *(t.get(c, _DEFAULTS.get(c)) for c in _TRACK_COLUMNS[:-1]),
+                      json.dumps(t['meta']) if t.get('meta') else None)
+                     for i, t in enumerate(tracks)])
+                meta = {**meta, 'version': version, 'hash': digest, 'saved_at': time.time()}
+                conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                 [(k, str(v)) for k, v in meta.items()])
+            return version
+        except (OSError, sqlite3.Error):
+            return None
+        finally:
+            conn.close()
+
+    def _shipped_meta(self):
+        """The shipped snapshot's meta table (values as stored), or {}."""
+        if not self.readonly_path or not os.path.exists(self.readonly_path):
+            return {}
+        try:
+            conn = self._open_ro(self.readonly_path)
+            try:
+                return dict(conn.execute('SELECT key, value FROM meta'))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return {}
+
+
+# ── Audio metadata ─────────────────────────────────────────
+# Duration, bitrate, sample rate and tags, extracted with mutagen in a
+# process pool and cached by (path, size, mtime) so re-indexing only reads
+# files that changed.
+_META_FIELDS = ('duration', 'bitrate', 'sample_rate', 'title', 'artist', 'album')
+
+_META_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS metadata (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    duration    REAL,
+    bitrate     INTEGER,
+    sample_rate INTEGER,
+    title       TEXT,
+    artist      TEXT,
+    album       TEXT
+);
+'''
+
+
+def read_audio_metadata(path):
+    """Return {duration, bitrate, sample_rate, title, artist, album} for one file.
+
+    Missing values are None. Runs in pool workers, so it must stay importable
+    at module level.
+    """
+    meta = dict.fromkeys(_META_FIELDS)
+    try:
+        import mutagen
+        audio = mutagen.File(path, easy=True)
+    except Exception:
+        return meta
+    if audio is None:
+        return meta
+    info = getattr(audio, 'info', None)
+    if info is not None:
+        meta['duration']    = round(getattr(info, 'length', 0) or 0, 3) or None
+        meta['bitrate']     = getattr(info, 'bitrate', None) or None
+        meta['sample_rate'] = getattr(info, 'sample_rate', None) or None
+    for key in ('title', 'artist', 'album'):
+        values = (audio.tags or {}).get(key) if audio.tags is not None else None
+        if values:
+            meta[key] = str(values[0])
+    return meta
+
+
+def _pool_context():
+    """Process start method that is safe to use from a threaded server."""
+    import multiprocessing   # deferred: only indexing needs it, not every cold start
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def map_in_pool(func, paths, workers=None, min_batch=8):
+    """Yield (path, func(path)) using a process pool, in-process for small batches.
+
+    Falls back to the current process where pools are unavailable
+    (e.g. serverless sandboxes without /dev/shm).
+    """
+    if len(paths) < min_batch or workers == 1:
+        for p in paths:
+            yield p, func(p)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    try:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+    except (OSError, NotImplementedError, ValueError):
+        for p in paths:
+            yield p, func(p)
+        return
+    with pool:
+        yield from zip(paths, pool.map(func, paths, chunksize=16))
+
+
+class MetadataIndex:
+    """Per-track audio metadata, persisted in SQLite and keyed by (size, mtime)."""
+
+    def __init__(self, root, db_path, workers=None):
+        self.root     = root
+        self.db_path  = db_path
+        self.workers  = workers
+        self._entries = None   # {rel_path: {'size', 'mtime_ns', **_META_FIELDS}}
+        self._lock    = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if not os.path.exists(self.db_path):
+            return
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                conn.row_factory = sqlite3.Row
+                for row in conn.execute('SELECT * FROM metadata'):
+                    entry = dict(row)
+                    self._entries[entry.pop('path')] = entry
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            self._entries = {}
+
+    def get(self, rel, sig):
+        """Metadata for `rel` if it was indexed at this (size, mtime_ns), else None."""
+        with self._lock:
+            self._load()
+            entry = self._entries.get(rel)
+        if entry is None or (entry['size'], entry['mtime_ns']) != tuple(sig):
+            return None
+        return {'size': entry['size'], **{k: entry[k] for k in _META_FIELDS}}
+
+    def stale(self, files):
+        """Paths in {rel: (size, mtime_ns)} with no metadata for their current signature."""
+        with self._lock:
+            self._load()
+            return [rel for rel, sig in files.items()
+                    if (e := self._entries.get(rel)) is None or (e['size'], e['mtime_ns']) != tuple(sig)]
+
+    def update(self, files):
+        """Index new/changed files from {rel: (size, mtime_ns)}; returns how many were read."""
+        todo = self.stale(files)
+        with self._lock:
+            gone = [rel for rel in self._entries if rel not in files]
+        if not todo and not gone:
+            return 0
+
+        abs_paths = {os.path.join(self.root, *rel.split('/')): rel for rel in todo}
+        results = {}
+        for path, meta in map_in_pool(read_audio_metadata, list(abs_paths), self.workers):
+            rel = abs_paths[path]
+            size, mtime_ns = files[rel]
+            results[rel] = {'size': size, 'mtime_ns': mtime_ns, **meta}
+
+        with self._lock:
+            for rel in gone:
+                self._entries.pop(rel, None)
+            self._entries.update(results)
+        self._save(results, gone)
+        return len(results)
+
+    def _save(self, results, gone):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10)
+        except (OSError, sqlite3.Error):
+            return
+        cols = ('size', 'mtime_ns') + _META_FIELDS
+        try:
+            with conn:
+                conn.executescript(_META_SCHEMA)
+                conn.executemany('DELETE FROM metadata WHERE path = ?', [(rel,) for rel in gone])
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO metadata (path, {", ".join(cols)}) '
+                    f'VALUES (?{", ?" * len(cols)})',
+                    [(rel, *(e[c] for c in cols)) for rel, e in results.items()])
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+
+
+# ── Search index ───────────────────────────────────────────
+# Prefix postings answer type-ahead queries directly; trigram postings add
+# typo-tolerant matches for words no prefix matches. The index is updated
+# per track, so a catalog refresh only touches tracks that changed.
+_MAX_PREFIX   = 10
+_FUZZY_CUTOFF = 0.5    # share of a query word's trigrams a track must contain
+_SEARCH_FIELDS = ('display', 'artist', 'subfolder', 'tag', 'url', 'meta')
+
+
+def _words(text):
+    return re.findall(r'\w+', unicodedata.normalize('NFKD', text or '').casefold())
+
+
+def _trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _search_keys(song):
+    """Posting keys for one song, tagged by kind: t=title prefix, o=other-field
+    prefix, w=whole title word, f=prefix of the title's first word, 3=trigram,
+    a=artist, g=tag."""
+    title = _words(song['display'])
+    meta  = song.get('meta') or {}
+    other = _words(f"{song['artist']} {song['subfolder']} {meta.get('title') or ''} {meta.get('album') or ''}")
+    keys  = {'a' + song['artist'].casefold(), 'g' + song['tag']}
+    keys.update(['w' + w for w in title])
+    if title:
+        keys.update(['f' + title[0][:n] for n in range(1, min(len(title[0]), _MAX_PREFIX) + 1)])
+    for kind, words in (('t', title), ('o', other)):
+        for w in words:
+            keys.update([kind + w[:n] for n in range(1, min(len(w), _MAX_PREFIX) + 1)])
+            keys.update(['3' + g for g in _trigrams(w)])
+    return keys, title
+
+
+class SearchIndex:
+    """In-memory prefix + trigram index over catalog songs, keyed by filename."""
+
+    def __init__(self):
+        self._docs     = {}                 # {filename: song}
+        self._order    = {}                 # {filename: position in catalog order}
+        self._title    = {}                 # {filename: (set(title words), normalised title)}
+        self._postings = defaultdict(set)   # {key: {filename, ...}}
+        self._by_name  = []                 # filenames sorted by display name
+        self._rank     = {}                 # {filename: position in _by_name}
+        self._lock     = threading.Lock()
+
+    def _index(self, song):
+        fn = song['filename']
+        keys, title = _search_keys(song)
+        postings = self._postings
+        for key in keys:
+            postings[key].add(fn)
+        self._docs[fn]  = song
+        self._title[fn] = (set(title), ' '.join(title))
+
+    def _unindex(self, fn):
+        keys, _title = _search_keys(self._docs.pop(fn))
+        for key in keys:
+            bucket = self._postings.get(key)
+            if bucket is not None:
+                bucket.discard(fn)
+                if not bucket:
+                    del self._postings[key]
+        self._title.pop(fn, None)
+
+    def update(self, songs):
+        """Sync the index with `songs`; returns (added, removed, changed) counts."""
+        with self._lock:
+            new = {s['filename']: s for s in songs}
+            removed = [fn for fn in self._docs if fn not in new]
+            added = changed = 0
+            for fn in removed:
+                self._unindex(fn)
+            self._order = {fn: i for i, fn in enumerate(new)}
+            for fn, song in new.items():
+                old = self._docs.get(fn)
+                if old is None:
+                    added += 1
+                elif any(old.get(f) != song.get(f) for f in _SEARCH_FIELDS):
+                    changed += 1
+                    self._unindex(fn)
+                else:
+                    self._docs[fn] = song   # same content; keep the newest object
+                    continue
+                self._index(song)
+            if added or removed or changed:
+                docs = self._docs
+                self._by_name = sorted(docs, key=lambda fn: (docs[fn]['display'].lower(), fn))
+                self._rank = {fn: i for i, fn in enumerate(self._by_name)}
+            return added, len(removed), changed
+
+    def _match_word(self, word):
+        """Return {filename: score} for one query word."""
+        scores = {}
+        for fn in self._postings.get('o' + word[:_MAX_PREFIX], ()):
+            scores[fn] = 2.0
+        for fn in self._postings.get('t' + word[:_MAX_PREFIX], ()):
+            scores[fn] = 4.0 if word in self._title[fn][0] else 3.0
+        if not scores and len(word) >= 3:
+            grams  = _trigrams(word)
+            shared = Counter()
+            for g in grams:
+                shared.update(self._postings.get('3' + g, ()))
+            for fn, n in shared.items():
+                sim = n / len(grams)
+                if sim >= _FUZZY_CUTOFF:
+                    scores[fn] = 2.0 * sim
+        return scores
+
+    def _in_name_order(self, pool, keep, n):
+        """Up to `n` filenames from `pool` accepted by `keep`, in display-name order."""
+        if n <= 0:
+            return []
+        if len(pool) * 8 < len(self._by_name):
+            return heapq.nsmallest(n, filter(keep, pool), key=self._rank.__getitem__)
+        # Dense pool: walking the name order finds the first n long before a full pass
+        hits = []
+        for fn in self._by_name:
+            if fn in pool and keep(fn):
+                hits.append(fn)
+                if len(hits) == n:
+                    break
+        return hits
+
+    def _prefix_search(self, word, allowed, limit):
+        """Fast path for a one-word prefix query; None if the word needs fuzzy matching.
+
+        Same ranking as the scored path, taken tier by tier: exact title word
+        with the title starting with it (5), exact word or title start (4),
+        title prefix (3), other fields (2). Each tier stops once the page is
+        full, so broad prefixes like "t" do not score the whole catalog.
+        """
+        post   = self._postings
+        prefix = post.get('t' + word, set())
+        other  = post.get('o' + word, set())
+        if not prefix and not other:
+            return None
+        exact = post.get('w' + word, set())
+        first = post.get('f' + word, set())
+        ok    = (lambda fn: True) if allowed is None else allowed.__contains__
+        tiers = ((exact & first, ok),
+                 (exact ^ first, ok),
+                 (prefix, lambda fn: fn not in exact and fn not in first and ok(fn)),
+                 (other, lambda fn: fn not in prefix and ok(fn)))
+        hits = []
+        for pool, keep in tiers:
+            hits += self._in_name_order(pool, keep, limit - len(hits))
+        matched = prefix | other
+        if allowed is not None:
+            matched &= allowed
+        return [self._docs[fn] for fn in hits], len(matched)
+
+    def search(self, query='', artist=None, tag=None, limit=50):
+        """Rank songs matching every word of `query` (fuzzily), optionally filtered.
+
+        Returns (songs, total_matches).
+        """
+        words = _words(query)
+        with self._lock:
+            allowed = None
+            if artist:
+                allowed = set(self._postings.get('a' + artist.casefold(), ()))
+            if tag:
+                by_tag = self._postings.get('g' + tag.upper(), set())
+                allowed = by_tag if allowed is None else allowed & by_tag
+
+            if not words:
+                # No text query: filtered songs in catalog order
+                pool = self._docs if allowed is None else allowed
+                hits = sorted(pool, key=self._order.__getitem__)
+                return [self._docs[fn] for fn in hits[:limit]], len(hits)
+
+            if len(words) == 1 and len(words[0]) <= _MAX_PREFIX:
+                found = self._prefix_search(words[0], allowed, limit)
+                if found is not None:
+                    return found
+
+            total = None
+            for w in words:
+                scores = self._match_word(w)
+                if total is None:
+                    total = scores
+                else:
+                    total = {fn: total[fn] + s for fn, s in scores.items() if fn in total}
+                if not total:
+                    return [], 0
+            if allowed is not None:
+                total = {fn: s for fn, s in total.items() if fn in allowed}
+
+            # Titles that start with the whole query rank first among equals
+            q = ' '.join(words)
+            ranked = heapq.nsmallest(
+                limit, total,
+                key=lambda fn: (-(total[fn] + (1.0 if self._title[fn][1].startswith(q) else 0.0)),
+                                self._rank[fn]))
+            return [self._docs[fn] for fn in ranked], len(total)
+
+    def __len__(self):
+        return len(self._docs)
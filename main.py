@@ -8,6 +8,9 @@ import customtkinter as ctk
 import pygame
 from mutagen.mp3 import MP3
 
+from analysis import AnalysisIndex, AnalysisUnavailable, gain_db
+from library import CatalogStore, LibraryIndex, MetadataIndex, SearchIndex
+
 # Set appearance
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("dark-blue")
@@ -23,6 +26,9 @@ TEXT_MUTED = "#9fb2c3"
 RADIUS = 14
 CARD_PAD = 25
 
+# Playback loudness (LUFS) that tracks are normalised to; same default as the web app
+LOUDNESS_TARGET = float(os.environ.get("LOUDNESS_TARGET", "-14"))
+
 ARTIST_FOLDERS = [
     "JuiceWrld",
     "Destroy Lonely",
@@ -63,6 +69,14 @@ class Leakify(ctk.CTk):
             artist_dir = os.path.join(self.music_folder, artist)
             if not os.path.exists(artist_dir):
                 os.makedirs(artist_dir)
+        self.library = LibraryIndex(self.music_folder, exts=(".mp3",))
+        self.library_scanned = False
+        self.catalog_store = CatalogStore(os.path.join(os.getcwd(), ".cache", "desktop-catalog.db"))
+        # Shared with the web app, which indexes the same folder
+        self.search_index = SearchIndex()
+        self.songs_by_rel = {}
+        self.metadata = MetadataIndex(self.music_folder, os.path.join(os.getcwd(), ".cache", "metadata.db"))
+        self.analysis = AnalysisIndex(self.music_folder, os.path.join(os.getcwd(), ".cache", "analysis"))
 
         self.songs = []  # list of dicts: {"display": str, "path": str}
         self.all_songs = []
@@ -235,21 +249,90 @@ class Leakify(ctk.CTk):
         self.update_progress = False
         self.progress_thread = None
 
-        self.refresh_library()
+        # Show the last known library instantly, then rescan the disk off the UI thread
+        self.load_library_snapshot()
+        threading.Thread(target=self.refresh_library_in_background, daemon=True).start()
+
+    def load_library_snapshot(self):
+        snapshot = self.catalog_store.load()
+        if not snapshot:
+            return
+        rows, _meta = snapshot
+        self.set_library([
+            {"display": r["display"], "path": os.path.join(self.music_folder, *r["filename"].split("/")), "artist": r["artist"], "rel": r["filename"],
+             "gain_db": r["gain_db"]}
+            for r in rows
+        ])
+
+    def scan_library(self):
+        """Rescan the music folder; returns the new song list, or None if nothing changed."""
+        diff = self.library.scan()
+        if self.library_scanned and not any(diff):
+            return None
+        self.library_scanned = True
+
+        songs, rows = [], []
+        for rel in self.library.paths():
+            parts = rel.split("/")
+            artist = parts[0] if len(parts) > 1 else "Unsorted"
+            # Clean display name: just filename without extension
+            display_name = os.path.splitext(parts[-1])[0]
+            songs.append({"display": display_name, "path": os.path.join(self.music_folder, *parts), "artist": artist, "rel": rel,
+                          "gain_db": self.track_gain_db(rel)})
+        self.save_catalog(songs)
+        return songs
+
+    def save_catalog(self, songs):
+        self.catalog_store.save([
+            {"filename": song["rel"], "display": song["display"], "artist": song["artist"],
+             "subfolder": "/".join(song["rel"].split("/")[1:-1]), "gain_db": song["gain_db"]}
+            for song in songs
+        ], source="desktop")
+
+    def track_gain_db(self, rel):
+        """Playback gain to LOUDNESS_TARGET for `rel` at its current signature, or None if not measured."""
+        sig = self.library.files.get(rel)
+        measured = self.analysis.loudness(rel, sig) if sig else None
+        return gain_db(*measured, LOUDNESS_TARGET) if measured else None
 
     def refresh_library(self):
-        self.all_songs = []
-        artists_found = set()
-        for root, _dirs, files in os.walk(self.music_folder):
-            for f in files:
-                if f.lower().endswith('.mp3'):
-                    full_path = os.path.join(root, f)
-                    rel = os.path.relpath(full_path, self.music_folder).replace("\\", "/")
-                    artist = rel.split("/", 1)[0] if "/" in rel else "Unsorted"
-                    artists_found.add(artist)
-                    # Clean display name: just filename without extension
-                    display_name = os.path.splitext(f)[0]
-                    self.all_songs.append({"display": display_name, "path": full_path, "artist": artist})
+        songs = self.scan_library()
+        if songs is not None:
+            self.set_library(songs)
+            threading.Thread(target=self.index_metadata, daemon=True).start()
+
+    def refresh_library_in_background(self):
+        songs = self.scan_library()
+        if songs is not None:
+            self.after(0, self.set_library, songs)
+        self.index_metadata()
+
+    def index_metadata(self):
+        """Read duration/tags and measure loudness for new or changed tracks (process pool, off the UI thread)."""
+        files = self.library.signatures()
+        try:
+            self.metadata.update(files)
+        except Exception as e:
+            print(f"Metadata indexing failed: {e}")
+        try:
+            if self.analysis.update(files):
+                songs = [dict(song, gain_db=self.track_gain_db(song["rel"])) for song in self.all_songs]
+                self.save_catalog(songs)
+                self.after(0, self.set_library, songs)
+        except AnalysisUnavailable:
+            pass
+        except Exception as e:
+            print(f"Audio analysis failed: {e}")
+
+    def set_library(self, songs):
+        self.all_songs = songs
+        self.songs_by_rel = {song["rel"]: song for song in songs}
+        self.search_index.update([
+            {"filename": song["rel"], "display": song["display"], "artist": song["artist"],
+             "subfolder": "/".join(song["rel"].split("/")[1:-1]), "tag": ""}
+            for song in songs
+        ])
+        artists_found = {song["artist"] for song in songs}
 
         artists_sorted = sorted(artists_found) if artists_found else ["Unsorted"]
         dropdown_values = ["All"] + artists_sorted
@@ -268,18 +351,24 @@ class Leakify(ctk.CTk):
             self.now_playing.configure(text="Now Playing: Add .mp3 files to Leakify-music-src")
             return
 
-        song_path = self.songs[self.current_index]["path"]
+        song = self.songs[self.current_index]
+        song_path = song["path"]
         self.current_path = song_path
-        try:
-            audio = MP3(song_path)
-            self.song_length = audio.info.length
-        except Exception:
-            self.song_length = 0
+        sig = self.library.files.get(song.get("rel"))
+        meta = self.metadata.get(song["rel"], sig) if sig else None
+        if meta and meta["duration"]:
+            self.song_length = meta["duration"]
+        else:
+            try:
+                audio = MP3(song_path)
+                self.song_length = audio.info.length
+            except Exception:
+                self.song_length = 0
 
         try:
             pygame.mixer.music.load(song_path)
             pygame.mixer.music.play()
-            pygame.mixer.music.set_volume(self.volume_slider.get() / 100)
+            self.set_volume(self.volume_slider.get())
             self.is_playing = True
             self.is_paused = False
             self.end_reached = False
@@ -305,7 +394,10 @@ class Leakify(ctk.CTk):
             self.is_paused = False
 
     def set_volume(self, val):
-        pygame.mixer.music.set_volume(val / 100)
+        # Loudness normalisation on top of the slider; pygame cannot amplify past 1.0
+        gain = self.songs[self.current_index].get("gain_db") if 0 <= self.current_index < len(self.songs) else None
+        factor = 10 ** (gain / 20) if gain is not None else 1.0
+        pygame.mixer.music.set_volume(min(1.0, val / 100 * factor))
 
     def stop_song(self):
         pygame.mixer.music.stop()
@@ -380,13 +472,12 @@ class Leakify(ctk.CTk):
     def apply_filters(self):
         query = self.search_var.get().lower().strip()
         artist_filter = self.artist_var.get()
-        self.songs = []
-        for song in self.all_songs:
-            if artist_filter != "All" and song["artist"] != artist_filter:
-                continue
-            if query and query not in song["display"].lower():
-                continue
-            self.songs.append(song)
+        if query:
+            hits, _total = self.search_index.search(
+                query, artist=None if artist_filter == "All" else artist_filter, limit=len(self.all_songs))
+            self.songs = [self.songs_by_rel[hit["filename"]] for hit in hits]
+        else:
+            self.songs = [song for song in self.all_songs if artist_filter == "All" or song["artist"] == artist_filter]
 
         for widget in self.song_list.winfo_children():
             widget.destroy()
@@ -0,0 +1,144 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Just enough of a Prometheus client for app.py: labelled counters and
+histograms that cost a lock and a bisect per observation, plus gauges read
+from callbacks at scrape time so existing stats() dicts can be exported
+without double bookkeeping.
+"""
+from bisect import bisect_left
+import threading
+import time
+
+# Seconds; covers a cached 304 (~1 ms) up to a cold bucket walk
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _num(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock   = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_labels(self.labels, labels)} {_num(value)}'
+
+
+class Histogram:
+    """Bucketed observations per label set (cumulative only when rendered)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # {labels: [counts per bucket + overflow, sum]}
+        self._lock   = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1]    += value
+
+    def time(self, *labels):
+        """Context manager observing the wall time of its block."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total))
+                           for labels, (counts, total) in self._series.items())
+        les = ['le="%s"' % b for b in self.buckets] + ['le="+Inf"']
+        for labels, (counts, total) in items:
+            running = 0
+            for le, n in zip(les, counts):
+                running += n
+                yield f'{self.name}_bucket{_labels(self.labels, labels, le)} {running}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {_num(total)}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {running}'
+
+
+class _Timer:
+    __slots__ = ('hist', 'labels', 't0')
+
+    def __init__(self, hist, labels):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labels)
+        return False
+
+
+class Gauge:
+    """Values read at scrape time from `fn`, which returns {label values: value}.
+
+    Pass kind='counter' when `fn` reports a running total kept elsewhere.
+    """
+
+    def __init__(self, name, help, labels, fn, kind='gauge'):
+        self.name, self.help, self.labels, self.fn = name, help, tuple(labels), fn
+        self.kind = kind
+
+    def samples(self):
+        for labels, value in sorted(self.fn().items()):
+            yield f'{self.name}{_labels(self.labels, labels)} {_num(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, labels, fn, kind='gauge'):
+        return self._add(Gauge(name, help, labels, fn, kind))
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for m in self._metrics:
+            lines.append(f'# HELP {m.name} {m.help}')
+            lines.append(f'# TYPE {m.name} {m.kind}')
+            lines.extend(m.samples())
+        return '\n'.join(lines) + '\n'
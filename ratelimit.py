@@ -0,0 +1,231 @@
+"""Login attempt stores for the brute-force lockout in app.py.
+
+Every store answers the same three questions in O(1) per call: is this key
+locked, record a failure, forget the key. Failures count inside a fixed
+window that starts at the first one; reaching `max_attempts` locks the key
+for `lockout` seconds and resets the count. Entries expire on their own,
+and each store caps how many keys it holds so a spray of bogus IPs cannot
+grow it without bound.
+
+  MemoryAttemptStore  one process (thread-safe)
+  SqliteAttemptStore  every worker sharing a file on this host
+  RedisAttemptStore   every instance sharing a Redis-compatible server
+"""
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+class MemoryAttemptStore:
+    """Per-process store: an LRU of key → [count, window_start, locked_until]."""
+
+    def __init__(self, max_attempts, window, lockout, max_entries=10000):
+        self.max_attempts = max_attempts
+        self.window       = window
+        self.lockout      = lockout
+        self.max_entries  = max_entries
+        self._entries     = OrderedDict()
+        self._lock        = threading.Lock()
+
+    def _expired(self, rec, now):
+        return rec[2] <= now and now - rec[1] > self.window
+
+    def locked(self, key, now=None):
+        """Seconds left on the key's lockout, 0 if it may try again."""
+        now = now or time.time()
+        with self._lock:
+            rec = self._entries.get(key)
+            return max(int(rec[2] - now), 1) if rec and rec[2] > now else 0
+
+    def record_failure(self, key, now=None):
+        """Count a failure; returns (failures in window, locked now)."""
+        now = now or time.time()
+        with self._lock:
+            rec = self._entries.get(key)
+            if rec is None or self._expired(rec, now):
+                rec = self._entries[key] = [0, now, 0.0]
+            elif now - rec[1] > self.window:
+                rec[0], rec[1] = 0, now
+            self._entries.move_to_end(key)
+            rec[0] += 1
+            if rec[0] >= self.max_attempts:
+                rec[0], rec[2] = 0, now + self.lockout
+                locked = True
+            else:
+                locked = False
+            count = rec[0]
+            # Least recently failed first: drop what has expired, then enforce the cap
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if len(self._entries) <= self.max_entries and not self._expired(oldest, now):
+                    break
+                self._entries.popitem(last=False)
+            return count, locked
+
+    def reset(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries),
+                    'max_entries': self.max_entries}
+
+
+_SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS attempts (
+    key          TEXT PRIMARY KEY,
+    count        INTEGER NOT NULL,
+    window_start REAL NOT NULL,
+    locked_until REAL NOT NULL,
+    expires_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_expires ON attempts (expires_at);
+'''
+
+
+class SqliteAttemptStore:
+    """Store shared by every process that opens the same SQLite file.
+
+    Each failure is one IMMEDIATE transaction, so SQLite's file lock makes the
+    read-modify-write atomic across gunicorn workers. Expired rows and rows
+    past `max_entries` are pruned every `prune_every` writes.
+    """
+
+    def __init__(self, path, max_attempts, window, lockout, max_entries=10000, prune_every=64):
+        self.path         = path
+        self.max_attempts = max_attempts
+        self.window       = window
+        self.lockout      = lockout
+        self.max_entries  = max_entries
+        self.prune_every  = prune_every
+        self._writes      = 0
+        self._writes_lock = threading.Lock()
+        self._local       = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SQLITE_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def locked(self, key, now=None):
+        now = now or time.time()
+        row = self._conn().execute(
+            'SELECT locked_until FROM attempts WHERE key = ?', (key,)).fetchone()
+        return max(int(row[0] - now), 1) if row and row[0] > now else 0
+
+    def record_failure(self, key, now=None):
+        now  = now or time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT count, window_start, locked_until FROM attempts '
+                               'WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+            count, window_start, locked_until = row or (0, now, 0.0)
+            if now - window_start > self.window:
+                count, window_start = 0, now
+            count += 1
+            locked = count >= self.max_attempts
+            if locked:
+                count, locked_until = 0, now + self.lockout
+            conn.execute('INSERT OR REPLACE INTO attempts VALUES (?, ?, ?, ?, ?)',
+                         (key, count, window_start, locked_until,
+                          max(window_start + self.window, locked_until)))
+            with self._writes_lock:
+                self._writes += 1
+                prune = self._writes % self.prune_every == 0
+            if prune:
+                self._prune(conn, now)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return count, locked
+
+    def _prune(self, conn, now):
+        conn.execute('DELETE FROM attempts WHERE expires_at <= ?', (now,))
+        over = conn.execute('SELECT COUNT(*) FROM attempts').fetchone()[0] - self.max_entries
+        if over > 0:
+            conn.execute('DELETE FROM attempts WHERE key IN '
+                         '(SELECT key FROM attempts ORDER BY expires_at LIMIT ?)', (over,))
+
+    def reset(self, key):
+        self._conn().execute('DELETE FROM attempts WHERE key = ?', (key,))
+
+    def stats(self):
+        return {'backend': 'sqlite', 'path': self.path, 'max_entries': self.max_entries,
+                'entries': self._conn().execute('SELECT COUNT(*) FROM attempts').fetchone()[0]}
+
+
+class RedisAttemptStore:
+    """Store shared through any client with the redis-py pipeline/SET/INCR/TTL API.
+
+    The failure counter and the lock are separate keys that Redis expires by
+    itself; the entry cap is the server's maxmemory policy (use volatile-ttl
+    or allkeys-lru), since every key written here carries a TTL.
+    """
+
+    def __init__(self, client, max_attempts, window, lockout, prefix='leakify:login:'):
+        self.client       = client
+        self.max_attempts = max_attempts
+        self.window       = window
+        self.lockout      = lockout
+        self.prefix       = prefix
+
+    def locked(self, key, now=None):
+        ttl = self.client.ttl(f'{self.prefix}lock:{key}')
+        return max(int(ttl), 0)
+
+    def record_failure(self, key, now=None):
+        fails = f'{self.prefix}fails:{key}'
+        # One MULTI/EXEC: the counter is created with its TTL, so no crash
+        # between commands can leave a key that never expires
+        pipe = self.client.pipeline()
+        pipe.set(fails, 0, nx=True, ex=self.window)
+        pipe.incr(fails)
+        count = int(pipe.execute()[1])
+        if count >= self.max_attempts:
+            self.client.set(f'{self.prefix}lock:{key}', 1, ex=self.lockout)
+            self.client.delete(fails)
+            return 0, True
+        return count, False
+
+    def reset(self, key):
+        self.client.delete(f'{self.prefix}fails:{key}', f'{self.prefix}lock:{key}')
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+def open_attempt_store(url, max_attempts, window, lockout, max_entries=10000, logger=None):
+    """Build a store from a URL: memory://, sqlite:///<path> or redis[s]://…
+
+    Falls back to the in-memory store (with a warning on `logger`, default
+    this module's) when the shared backend is unusable, so a
+    misconfiguration never disables the lockout.
+    """
+    limits = dict(max_attempts=max_attempts, window=window, lockout=lockout)
+    scheme = urlsplit(url).scheme if url else 'memory'
+    try:
+        if scheme == 'sqlite':
+            store = SqliteAttemptStore(url[len('sqlite:///'):], max_entries=max_entries, **limits)
+            store.locked('')   # open the file now, not on the first login
+            return store
+        if scheme in ('redis', 'rediss'):
+            import redis   # optional dependency
+            store = RedisAttemptStore(redis.Redis.from_url(url), **limits)
+            store.locked('')
+            return store
+    except Exception as e:
+        (logger or logging.getLogger(__name__)).warning(
+            f'Login rate-limit store {scheme} unavailable ({e}); using memory')
+    return MemoryAttemptStore(max_entries=max_entries, **limits)
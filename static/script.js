@@ -106,6 +106,39 @@ function loadArtistPhotos() {
   });
 }
 
+// ══════════════════════════════════════════
+//  COVER ART
+// ══════════════════════════════════════════
+// Songs with embedded art carry its hash as `art`; square WebP thumbnails are
+// served from /art/<hash>-<size>.webp (content-addressed, cached forever).
+const ART_SIZES = [96, 300, 600];
+
+function artUrl(song, size) {
+  return song && song.art ? `/art/${song.art}-${size}.webp` : null;
+}
+
+/** Show `src` over an art placeholder (hero / full player), or restore the placeholder. */
+function setCoverArt(el, src) {
+  if (!el) return;
+  let img = el.querySelector('.cover-art');
+  if (!src) {
+    if (img) img.remove();
+    return;
+  }
+  if (!img) {
+    img = document.createElement('img');
+    img.className = 'cover-art';
+    img.alt = '';
+    img.onload  = () => img.classList.add('loaded');
+    img.onerror = () => img.remove(); // keep the placeholder icon
+    el.appendChild(img);
+  }
+  if (img.getAttribute('src') !== src) {
+    img.classList.remove('loaded');
+    img.src = src;
+  }
+}
+
 // ── Generic debounce helper ──────────────────
 function debounce(fn, ms) {
   let id;
@@ -155,6 +188,9 @@ const VIZ_BARS   = 52;
 // ── App volume (persisted) — separate from system/device volume ──────────────
 let appVolume = parseFloat(localStorage.getItem('leakify-volume') ?? '0.8');
 if (isNaN(appVolume) || appVolume < 0 || appVolume > 1) appVolume = 0.8;
+// Loudness normalisation: linear factor from the current song's gain_db
+// (measured server-side), applied on top of appVolume
+let trackGain = 1;
 
 // ── Update toast ─────────────────────────────
 function showUpdateToast(msg, isError) {
@@ -182,15 +218,27 @@ function syncVolume(vol) {
 function setVolume(vol) {
   vol = Math.max(0, Math.min(1, vol));
   appVolume = vol;
+  applyVolume();
+  syncVolume(vol);
+}
+
+// ── Push appVolume × trackGain to the output ──
+function applyVolume() {
   if (gainNode) {
     // GainNode operates inside the Web Audio graph — works independently of
     // the OS/device volume slider, even on iOS where audio.volume is read-only.
-    gainNode.gain.setTargetAtTime(vol, audioCtx.currentTime, 0.015);
+    // It can also boost quiet tracks; gain_db already leaves peak headroom.
+    gainNode.gain.setTargetAtTime(audio.muted ? 0 : appVolume * trackGain, audioCtx.currentTime, 0.015);
   } else {
     // Fallback before first user gesture (AudioContext not yet created)
-    audio.volume = vol;
+    audio.volume = Math.min(1, appVolume * trackGain);
   }
-  syncVolume(vol);
+}
+
+// ── Set the normalisation gain for a newly started song ──
+function setTrackGain(song) {
+  trackGain = song && typeof song.gain_db === 'number' ? Math.pow(10, song.gain_db / 20) : 1;
+  applyVolume();
 }
 
 // ── Media Session API — iOS Lock Screen / Control Center / AirPods ──
@@ -198,14 +246,17 @@ function setVolume(vol) {
 function updateMediaSession(song) {
   if (!('mediaSession' in navigator)) return;
 
-  // ── Artwork: prefer Supabase cover art, fall back to app icons ──
-  // iOS caches artwork aggressively; include song filename as cache-buster.
+  // ── Artwork: prefer embedded cover art, fall back to app icons ──
+  // iOS caches artwork aggressively; include song filename as cache-buster
+  // (art URLs are content-addressed already).
   const artworkKey = encodeURIComponent(song.filename || song.display || '');
   navigator.mediaSession.metadata = new MediaMetadata({
     title:  song.display,
     artist: song.artist,
     album:  'Leakify \u00b7 Private Vault',
-    artwork: [
+    artwork: song.art ? ART_SIZES.map(size => (
+      { src: artUrl(song, size), sizes: `${size}x${size}`, type: 'image/webp' }
+    )) : [
       { src: `/static/icon-192.png?v=${artworkKey}`, sizes: '192x192', type: 'image/png' },
       { src: `/static/icon-512.png?v=${artworkKey}`, sizes: '512x512', type: 'image/png' },
       { src: `/static/icon-1024.png?v=${artworkKey}`, sizes: '1024x1024', type: 'image/png' },
@@ -634,18 +685,93 @@ function showPlayer() {
 // ══════════════════════════════════════════
 //  LIBRARY
 // ══════════════════════════════════════════
+// The library streams as NDJSON; the first screen renders as soon as it arrives
+const FIRST_SCREEN_SONGS = 40;
+
+async function readSongStream(res, onFirstScreen) {
+  // No streaming support (or a plain JSON reply): parse the whole body at once
+  if (!res.body || !(res.headers.get('Content-Type') || '').includes('ndjson')) {
+    return (await res.json()).songs || [];
+  }
+  const reader  = res.body.getReader();
+  const decoder = new TextDecoder();
+  const songs   = [];
+  let buffered  = '';
+  let shown     = false;
+  for (;;) {
+    const { value, done } = await reader.read();
+    buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+    const lines = buffered.split('\n');
+    buffered = lines.pop();
+    for (const line of lines) if (line.trim()) songs.push(JSON.parse(line));
+    if (!shown && songs.length >= FIRST_SCREEN_SONGS) {
+      shown = true;
+      onFirstScreen(songs.slice());
+    }
+    if (done) break;
+  }
+  if (buffered.trim()) songs.push(JSON.parse(buffered));
+  return songs;
+}
+
+// The last catalog is kept in localStorage; reloads only fetch what changed
+const CATALOG_KEY = 'leakify_catalog';
+
+function loadCachedCatalog() {
+  try {
+    const cached = JSON.parse(localStorage.getItem(CATALOG_KEY) || 'null');
+    return cached && Array.isArray(cached.songs) ? cached : null;
+  } catch (_) { return null; }
+}
+
+function saveCachedCatalog(version, songs) {
+  if (!version) return;
+  try { localStorage.setItem(CATALOG_KEY, JSON.stringify({ version, songs })); } catch (_) {}
+}
+
+// Same order as the server: artist, title (case-insensitive), then filename
+const songOrder = s => [s.artist.toLowerCase(), s.display.toLowerCase(), s.filename];
+function compareSongs(a, b) {
+  const ka = songOrder(a), kb = songOrder(b);
+  for (let i = 0; i < ka.length; i++) {
+    if (ka[i] !== kb[i]) return ka[i] < kb[i] ? -1 : 1;
+  }
+  return 0;
+}
+
+function applyCatalogDelta(songs, delta) {
+  const byName = new Map(songs.map(s => [s.filename, s]));
+  for (const fn of delta.removed) byName.delete(fn);
+  for (const s of delta.changed) byName.set(s.filename, s);
+  return [...byName.values()].sort(compareSongs);
+}
+
 async function loadLibrary() {
   // Show skeleton while loading
   showSkeletons(songList);
   try {
-    const res  = await fetch('/api/songs');
+    const cached = loadCachedCatalog();
+    const res    = cached
+      ? await fetch(`/api/songs?since=${encodeURIComponent(cached.version)}`)
+      : await fetch('/api/songs', { headers: { 'Accept': 'application/x-ndjson' } });
     // If session expired server-side, bounce back to login
     if (res.status === 401) {
       showScreen(screenLogin);
       return;
     }
-    const data = await res.json();
-    allSongs     = data.songs || [];
+    let version = Number(res.headers.get('X-Catalog-Version')) || 0;
+    if (cached) {
+      // Either a delta against our version or, if the server can't diff, a full snapshot
+      const data = await res.json();
+      version  = data.version || version;
+      allSongs = Array.isArray(data.songs) ? data.songs : applyCatalogDelta(cached.songs, data);
+    } else {
+      allSongs = await readSongStream(res, firstScreen => {
+        allSongs = firstScreen;
+        applyFilter();
+      });
+    }
+    saveCachedCatalog(version, allSongs);
     playHistory  = []; // reset play history whenever the library reloads
     buildPills();
     applyFilter();
@@ -690,11 +816,44 @@ function buildPills() {
   });
 }
 
+// Large catalogs are searched server-side (/api/search) instead of scanning every song
+const SERVER_SEARCH_MIN = 2000;
+const SEARCH_TAGS       = ['leaked', 'remaster', 'session', 'extra'];
+let searchSeq = 0;
+
+async function serverSearch(searchTerm, artistFilter) {
+  const params = new URLSearchParams({ limit: '500' });
+  if (SEARCH_TAGS.includes(searchTerm)) params.set('tag', searchTerm);
+  else params.set('q', searchTerm);
+  if (artistFilter !== 'all' && artistFilter !== 'liked') params.set('artist', artistFilter);
+  const res = await fetch(`/api/search?${params}`);
+  if (!res.ok) throw new Error(`search failed: ${res.status}`);
+  return (await res.json()).songs || [];
+}
+
 function applyFilter() {
   const activePill   = pillsInner.querySelector('.pill.active');
   const artistFilter = activePill ? activePill.dataset.artist : 'all';
   const searchTerm   = searchInput.value.trim().toLowerCase();
+  const seq          = ++searchSeq;
+
+  if (searchTerm && allSongs.length >= SERVER_SEARCH_MIN) {
+    serverSearch(searchTerm, artistFilter)
+      .then(hits => {
+        if (seq !== searchSeq) return; // superseded by a newer keystroke
+        const byFile = new Map(allSongs.map(s => [s.filename, s]));
+        filteredSongs = hits
+          .map(h => byFile.get(h.filename))
+          .filter(s => s && (artistFilter !== 'liked' || likes.has(s.filename)));
+        renderSongs();
+      })
+      .catch(() => { if (seq === searchSeq) filterLocally(artistFilter, searchTerm); });
+    return;
+  }
+  filterLocally(artistFilter, searchTerm);
+}
 
+function filterLocally(artistFilter, searchTerm) {
   filteredSongs = allSongs.filter(s => {
     const matchArtist = artistFilter === 'all'
       || (artistFilter === 'liked' ? likes.has(s.filename) : s.artist === artistFilter);
@@ -709,6 +868,57 @@ function applyFilter() {
   renderSongs();
 }
 
+// ══════════════════════════════════════════
+//  LAZY URL SIGNING
+// ══════════════════════════════════════════
+// With LAZY_SIGNING the catalog arrives without signed URLs; the tracks on
+// screen and the next SIGN_AHEAD in the queue are signed in batches via
+// /api/sign. Anything still unsigned at play time goes through /play.
+const SIGN_AHEAD = 10;
+const SIGN_BATCH = 100;
+const signWanted  = new Set();
+const signPending = new Set();
+let signTimer    = null;
+let signObserver = null;
+
+function requestUrls(songs) {
+  songs.forEach(s => {
+    if (s && !s.url && !signPending.has(s.filename)) signWanted.add(s.filename);
+  });
+  if (signWanted.size && !signTimer) signTimer = setTimeout(flushSignRequests, 50);
+}
+
+async function flushSignRequests() {
+  signTimer = null;
+  const paths = [...signWanted].slice(0, SIGN_BATCH);
+  paths.forEach(p => { signWanted.delete(p); signPending.add(p); });
+  try {
+    const res  = await fetch('/api/sign', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ paths }),
+    });
+    const urls = res.ok ? (await res.json()).urls || {} : {};
+    const byFile = new Map(allSongs.map(s => [s.filename, s]));
+    for (const [fn, url] of Object.entries(urls)) {
+      const song = byFile.get(fn);
+      if (song && !song.url) song.url = url;
+    }
+  } catch {}
+  paths.forEach(p => signPending.delete(p));
+  if (signWanted.size && !signTimer) signTimer = setTimeout(flushSignRequests, 50);
+}
+
+function setupSignObserver() {
+  if (signObserver) signObserver.disconnect();
+  signObserver = null;
+  if (!filteredSongs.some(s => !s.url)) return;
+  signObserver = new IntersectionObserver(entries => {
+    requestUrls(entries.filter(e => e.isIntersecting)
+                       .map(e => filteredSongs[Number(e.target.dataset.idx)]));
+  }, { rootMargin: '200px 0px' });
+}
+
 // ══════════════════════════════════════════
 //  RENDER
 // ══════════════════════════════════════════
@@ -748,10 +958,12 @@ function renderSongs() {
   }
 
   setupRevealObserver();
+  setupSignObserver();
 
   const fragment = document.createDocumentFragment();
   filteredSongs.forEach((song, idx) => {
     const card = document.createElement('div');
+    card.dataset.idx = idx;
     // Use reveal-ready for IntersectionObserver — first 12 cards animate immediately
     if (idx < 12) {
       card.className = 'track-card';
@@ -768,6 +980,7 @@ function renderSongs() {
         <svg viewBox="0 0 40 40" fill="none">
           <path d="M16 11v18l14-9-14-9z" fill="currentColor"/>
         </svg>
+        ${song.art ? `<img class="cover-art loaded" src="${artUrl(song, ART_SIZES[0])}" loading="lazy" decoding="async" alt="">` : ''}
         <div class="track-card-eq-overlay">
           <span></span><span></span><span></span>
         </div>
@@ -817,6 +1030,7 @@ function renderSongs() {
   songList.querySelectorAll('.track-card.reveal-ready').forEach(c => {
     cardRevealObserver && cardRevealObserver.observe(c);
   });
+  if (signObserver) songList.querySelectorAll('.track-card').forEach(c => signObserver.observe(c));
 }
 
 function escHtml(str) {
@@ -835,9 +1049,11 @@ function playSong(idx, skipHistory = false) {
   }
   currentIndex = idx;
   const song = filteredSongs[idx];
+  requestUrls(filteredSongs.slice(idx + 1, idx + 1 + SIGN_AHEAD));
 
   // Init Web Audio context on first user gesture
   initAudioVisualizer();
+  setTrackGain(song);
 
   // Show buffering indicator immediately for fast visual feedback
   const cards = songList.querySelectorAll('.track-card');
@@ -862,7 +1078,7 @@ function playSong(idx, skipHistory = false) {
             && !errStr.includes('AbortError')
             && !errStr.includes('NotSupportedError')) {
           _retried = true;
-          fetch(`/api/song-url?path=${encodeURIComponent(song.filename)}`)
+          fetch(`/api/song-url?path=${encodeURIComponent(song.filename)}&refresh=1`)
             .then(r => r.ok ? r.json() : null)
             .then(data => {
               if (data && data.url) {
@@ -889,6 +1105,7 @@ function setVinylSpin(playing) {
 }
 
 function onPlayStart(song) {
+  loadPeaks(song);
   // Track switch cross-fade — art wrapper morphs on every new song
   const fpoArtWrap  = fpo.querySelector('.fpo-art-wrap');
   const heroArtWrap = heroArt.closest('.hero-art-wrap') || heroArt.parentElement;
@@ -925,6 +1142,10 @@ function onPlayStart(song) {
   // Dynamic tint
   setArtTint(song.artist);
 
+  // Embedded cover art over the placeholders
+  setCoverArt(heroArt, artUrl(song, ART_SIZES[1]));
+  setCoverArt(fpoArt,  artUrl(song, ART_SIZES[2]));
+
   // iOS Media Session (lock screen / Control Center)
   updateMediaSession(song);
 
@@ -1103,6 +1324,7 @@ function openFPO() {
   fpo.style.transform = '';
   // Start visualizer loop now that FPO is visible
   if (analyserNode) startVisualizer();
+  drawWaveform();
   // Trigger FPO morph entrance — restart animations on each open
   const fpoOpenEls = [
     fpo.querySelector('.fpo-art-wrap'),
@@ -1365,10 +1587,8 @@ function setupAllEvents() {
     // M = mute/unmute
     if (e.code === 'KeyM') {
       audio.muted = !audio.muted;
-      if (gainNode) {
-        // Drive GainNode so mute works even on iOS where audio.muted may be unreliable
-        gainNode.gain.setTargetAtTime(audio.muted ? 0 : appVolume, audioCtx.currentTime, 0.015);
-      }
+      // Drive GainNode so mute works even on iOS where audio.muted may be unreliable
+      if (gainNode) applyVolume();
       const opacity = audio.muted ? '0.4' : '1';
       if (fpoVolume) fpoVolume.style.opacity = opacity;
     }
@@ -1985,7 +2205,7 @@ function initAudioVisualizer() {
     analyserNode.smoothingTimeConstant = 0.80;
     // GainNode provides app-level volume independent of device volume (essential on iOS)
     gainNode = audioCtx.createGain();
-    gainNode.gain.value = appVolume;
+    gainNode.gain.value = appVolume * trackGain;
     audio.volume = 1; // hand full control to GainNode from this point on
     src.connect(analyserNode);
     analyserNode.connect(gainNode);
@@ -2068,6 +2288,76 @@ function drawVisualizer() {
   canvas.classList.toggle('idle', !isPlaying);
 }
 
+// ══════════════════════════════════════════
+//  WAVEFORM PEAKS
+// ══════════════════════════════════════════
+// Min/max peaks precomputed by the server (/api/peaks) are drawn behind the
+// scrubber, so the waveform shows up without decoding audio on the device.
+const PEAKS_CACHE_MAX = 50;
+const peaksCache = new Map();   // filename → [Int8Array of min/max pairs per level] | null
+let currentPeaks = null;
+let peaksFor     = null;
+
+function parsePeaks(buf) {
+  // 'LKPK' | u8 version | u8 levels | u16 | u32 rate | u32 frames | u32 buckets × levels | int8 pairs
+  const dv = new DataView(buf);
+  if (buf.byteLength < 16 || dv.getUint32(0) !== 0x4C4B504B || dv.getUint8(4) !== 1) return null;
+  const n = dv.getUint8(5);
+  const levels = [];
+  let pos = 16 + 4 * n;
+  for (let i = 0; i < n; i++) {
+    const count = dv.getUint32(16 + 4 * i, true);
+    levels.push(new Int8Array(buf, pos, 2 * count));
+    pos += 2 * count;
+  }
+  return levels;
+}
+
+async function loadPeaks(song) {
+  peaksFor = song.filename;
+  let levels = peaksCache.get(song.filename);
+  if (levels === undefined) {
+    try {
+      const res = await fetch(`/api/peaks/${encodeURIComponent(song.filename)}`);
+      levels = res.ok ? parsePeaks(await res.arrayBuffer()) : null;
+    } catch {
+      levels = null;
+    }
+    peaksCache.set(song.filename, levels);
+    if (peaksCache.size > PEAKS_CACHE_MAX) peaksCache.delete(peaksCache.keys().next().value);
+  }
+  if (peaksFor !== song.filename) return;   // another track started meanwhile
+  currentPeaks = levels;
+  drawWaveform();
+}
+
+function drawWaveform() {
+  const canvas = $('fpo-waveform');
+  if (!canvas) return;
+  const dpr = window.devicePixelRatio || 1;
+  const W   = canvas.offsetWidth;
+  const H   = canvas.offsetHeight;
+  canvas.classList.toggle('visible', !!currentPeaks && W > 0);
+  if (!currentPeaks || !W) return;
+  canvas.width  = W * dpr;
+  canvas.height = H * dpr;
+
+  // Coarsest level with at least one bucket per 2 device pixels
+  const bars  = Math.floor(canvas.width / 2);
+  const level = currentPeaks.find(l => l.length / 2 >= bars) || currentPeaks[currentPeaks.length - 1];
+  const count = level.length / 2;
+  const ctx   = canvas.getContext('2d');
+  const mid   = canvas.height / 2;
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  ctx.fillStyle = 'rgba(255,255,255,0.16)';
+  for (let x = 0; x < bars; x++) {
+    const i  = Math.floor(x * count / bars) * 2;
+    const lo = Math.min(level[i] / 127, -0.02);
+    const hi = Math.max(level[i + 1] / 127, 0.02);
+    ctx.fillRect(x * 2, mid - hi * mid, 1, (hi - lo) * mid);
+  }
+}
+
 // ══════════════════════════════════════════
 //  LIKES / FAVORITES
 // ══════════════════════════════════════════